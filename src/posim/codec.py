@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+""" Compact delta and varint encoding of simulated tracks """
+
+import struct
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b'PSMT'
+VERSION = 1
+
+# Header flags
+_DATETIME = 1
+_REGULAR = 2
+
+_HEADER = struct.Struct('<4sBBdIQ')
+_TIME = struct.Struct('<ddd')
+
+
+def _zigzag(values):
+    """ Maps signed integers to unsigned so small magnitudes stay small """
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values):
+    """ Inverse of _zigzag """
+    return ((values >> np.uint64(1)).astype(np.int64)
+            ^ -(values & np.uint64(1)).astype(np.int64))
+
+
+def varint_encode(values):
+    """
+    Encodes unsigned integers as little endian base 128 varints.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Array of unsigned integers.
+
+    Returns
+    -------
+    bytes
+        The encoded integers, one after another.
+    """
+
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return b''
+
+    # Number of 7 bit groups of each value
+    n_groups = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        n_groups += rest > 0
+        rest = rest >> np.uint64(7)
+
+    group = np.arange(n_groups.max())
+    shifts = (7*group).astype(np.uint64)
+    out = ((values[:, None] >> shifts) & np.uint64(0x7f)).astype(np.uint8)
+    out[group < n_groups[:, None] - 1] |= 0x80
+
+    return out[group < n_groups[:, None]].tobytes()
+
+
+def varint_decode(data, count):
+    """
+    Decodes the first count varints of a buffer.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Buffer of varints written by varint_encode.
+    count : int
+        Number of integers to decode.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of unsigned integers.
+    """
+
+    if count == 0:
+        return np.empty(0, dtype=np.uint64)
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(buf < 0x80)[:count]
+    if len(ends) < count:
+        raise ValueError("Buffer ends before count varints were read.")
+    buf = buf[:ends[-1] + 1]
+
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.arange(len(buf)) - np.repeat(starts, ends - starts + 1)
+    parts = ((buf & 0x7f).astype(np.uint64)
+             << (7*group).astype(np.uint64))
+
+    return np.bitwise_or.reduceat(parts, starts)
+
+
+def _delta_ints(values):
+    """ First value followed by the differences between successive values """
+    return np.diff(values, prepend=np.int64(0))
+
+
+def encode(result, precision=1e-7, chunk_size=4096, time_precision=1e-6):
+    """
+    Encodes the name, times and coordinates of a simulated track.
+
+    Latitude and longitude are quantized to precision degrees, and each
+    chunk of fixes is stored as the first value and the differences between
+    successive values, zigzag and varint encoded. Regular times are stored
+    as a start time and timestep only. The x and y direction vectors are not
+    stored.
+
+    Parameters
+    ----------
+    result : dict
+        Dictionary of results returned by Simulation.run_sim.
+    precision : float
+        Quantization step of latitude and longitude in degrees. The default
+        of 1e-7 is about a centimetre.
+    chunk_size : int
+        Number of fixes per chunk. Each chunk can be decoded on its own.
+    time_precision : float
+        Quantization step of stime when the times are not regular.
+
+    Returns
+    -------
+    bytes
+        The encoded track.
+    """
+
+    stime = np.asarray(result['stime'], dtype=float)
+    lat = np.round(np.asarray(result['lat'], dtype=float)/precision)
+    lon = np.round(np.asarray(result['lon'], dtype=float)/precision)
+    lat = lat.astype(np.int64)
+    lon = lon.astype(np.int64)
+    n = len(stime)
+
+    flags = 0
+    dtime0 = result['dtime'][0] if n else 0.
+    if isinstance(dtime0, datetime):
+        flags |= _DATETIME
+        # dtime is start_time + stime, so only the offset is stored
+        offset = (np.datetime64(dtime0, 'us')
+                  - np.datetime64('1970-01-01T00:00:00', 'us'))
+        offset = offset.astype(np.float64)/1e6 - (stime[0] if n else 0.)
+    else:
+        offset = float(dtime0) - (stime[0] if n else 0.)
+
+    steps = np.diff(stime)
+    if n < 2 or np.allclose(steps, steps[0], rtol=0, atol=1e-9):
+        flags |= _REGULAR
+        time_fields = (stime[0] if n else 0.,
+                       steps[0] if n > 1 else 0., offset)
+    else:
+        time_fields = (time_precision, 0., offset)
+        times = np.round(stime/time_precision).astype(np.int64)
+
+    name = str(result['name']).encode('utf-8')
+    chunks = []
+    for start in range(0, n, chunk_size):
+        stop = start + chunk_size
+        ints = [_delta_ints(lat[start:stop]), _delta_ints(lon[start:stop])]
+        if not flags & _REGULAR:
+            ints.append(_delta_ints(times[start:stop]))
+        chunks.append(varint_encode(_zigzag(np.concatenate(ints))))
+
+    offsets = np.concatenate(([0], np.cumsum([len(c) for c in chunks])))
+
+    return b''.join([_HEADER.pack(MAGIC, VERSION, flags, precision,
+                                  chunk_size, n),
+                     _TIME.pack(*time_fields),
+                     struct.pack('<H', len(name)), name,
+                     offsets.astype('<u8').tobytes()]
+                    + chunks)
+
+
+class TrackReader:
+    """
+    Attributes
+    ----------
+    name : str
+        Name of the character.
+    n_fixes : int
+        Number of fixes in the track.
+    n_chunks : int
+        Number of chunks in the track.
+    chunk_size : int
+        Number of fixes per chunk.
+
+    Methods
+    -------
+
+    __init__(data):
+        Reads the header of an encoded track.
+
+    read_chunk(i):
+        Decodes a single chunk of fixes.
+
+    read(start, stop):
+        Decodes the fixes from start up to but excluding stop.
+
+    close():
+        Releases the data, closing it if it is a memory map.
+
+    A TrackReader can also be used as a context manager, which closes it on
+    exit.
+    """
+
+    def __init__(self, data):
+        """
+        Reads the header of an encoded track.
+
+        Parameters
+        ----------
+        data : bytes-like
+            Track returned by encode, or a memory map of a file holding one.
+        """
+
+        self._source = data
+        self._data = memoryview(data)
+
+        (magic, version, self._flags, self._precision, self.chunk_size,
+         self.n_fixes) = _HEADER.unpack_from(self._data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Data is not a track written by encode.")
+
+        pos = _HEADER.size
+        self._time_fields = _TIME.unpack_from(self._data, pos)
+        pos += _TIME.size
+
+        (name_len,) = struct.unpack_from('<H', self._data, pos)
+        pos += 2
+        self.name = bytes(self._data[pos:pos + name_len]).decode('utf-8')
+        pos += name_len
+
+        self.n_chunks = -(-self.n_fixes//self.chunk_size)
+        self._offsets = np.frombuffer(self._data, dtype='<u8',
+                                      count=self.n_chunks + 1, offset=pos)
+        self._base = pos + 8*(self.n_chunks + 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """ Releases the data, closing it if it is a memory map """
+
+        # Views of the buffer must be released before a memory map closes
+        self._offsets = None
+        self._data.release()
+        if hasattr(self._source, 'close'):
+            self._source.close()
+
+    def _decode_chunk(self, i):
+        """ Returns the quantized lat, lon and times of a chunk """
+
+        n = min(self.chunk_size, self.n_fixes - i*self.chunk_size)
+        width = 2 if self._flags & _REGULAR else 3
+        start = self._base + int(self._offsets[i])
+        stop = self._base + int(self._offsets[i + 1])
+
+        ints = _unzigzag(varint_decode(self._data[start:stop], width*n))
+        return np.cumsum(ints.reshape(width, n), axis=1)
+
+    def read_chunk(self, i):
+        """
+        Decodes a single chunk of fixes.
+
+        Parameters
+        ----------
+        i : int
+            Index of the chunk.
+
+        Returns
+        -------
+        dict
+            Dictionary of the fixes, in the format returned by read.
+        """
+
+        return self.read(i*self.chunk_size, (i + 1)*self.chunk_size)
+
+    def read(self, start=0, stop=None):
+        """
+        Decodes the fixes from start up to but excluding stop, reading only
+        the chunks they fall in.
+
+        Parameters
+        ----------
+        start : int
+            Index of the first fix.
+        stop : int
+            Index after the last fix. Up to the last fix if None.
+
+        Returns
+        -------
+        dict
+            Dictionary of arrays of the decoded fixes:
+            - name: Name of the character
+            - dtime: Datetime / numeric time of each fix
+            - stime: Total time elapsed since the start of the simulation
+            - lat: Latitude of each fix
+            - lon: Longitude of each fix
+        """
+
+        if stop is None or stop > self.n_fixes:
+            stop = self.n_fixes
+        start = max(0, min(start, stop))
+
+        first = start//self.chunk_size
+        last = -(-stop//self.chunk_size)
+        if first < last:
+            chunks = np.concatenate([self._decode_chunk(i)
+                                     for i in range(first, last)], axis=1)
+        else:
+            chunks = np.empty((3, 0), dtype=np.int64)
+        chunks = chunks[:, start - first*self.chunk_size:
+                        stop - first*self.chunk_size]
+
+        if self._flags & _REGULAR:
+            stime = (self._time_fields[0]
+                     + self._time_fields[1]*np.arange(start, stop))
+        else:
+            stime = chunks[2]*self._time_fields[0]
+
+        offset = self._time_fields[2]
+        if self._flags & _DATETIME:
+            micros = np.round((stime + offset)*1e6).astype(np.int64)
+            dtime = micros.astype('datetime64[us]').astype(object)
+        else:
+            dtime = stime + offset
+
+        return {'name': self.name,
+                'dtime': dtime,
+                'stime': stime,
+                'lat': chunks[0]*self._precision,
+                'lon': chunks[1]*self._precision}
+
+
+def decode(data):
+    """
+    Decodes a whole track.
+
+    Parameters
+    ----------
+    data : bytes-like
+        Track returned by encode.
+
+    Returns
+    -------
+    dict
+        Dictionary of arrays of the decoded fixes, in the format returned by
+        TrackReader.read.
+    """
+
+    return TrackReader(data).read()
+
+
+def open_track(path):
+    """
+    Memory maps a file holding an encoded track, so chunks are only read
+    from disk when decoded. The map is closed by the close method of the
+    reader, or on leaving a with block.
+
+    Parameters
+    ----------
+    path : str
+        Path of the file.
+
+    Returns
+    -------
+    TrackReader
+        Reader of the track.
+    """
+    import mmap
+
+    with open(path, 'rb') as f:
+        return TrackReader(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
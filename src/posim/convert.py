@@ -5,10 +5,13 @@ Created on Sat Apr  3 22:26:25 2021
 @author: zrowl
 """
 
+import re
 import types
+import numpy as np
 from geographiclib.geodesic import Geodesic
 
-from paths import linear
+from .paths import linear
+from .geometry import enu, segments
 
 def coords2path(coords=[], geo=Geodesic.WGS84, interp_func_name='linear'):
     
@@ -47,3 +50,334 @@ def coords2path(coords=[], geo=Geodesic.WGS84, interp_func_name='linear'):
     lon_functype = types.FunctionType(lon_funcobj.co_consts[0], globals())
     
     return lat_functype, lon_functype, lat_funcstr, lon_funcstr, d
+
+
+def _chunks(lat, lon, chunk_size):
+    """ Splits coordinate arrays into chunks of at most chunk_size points """
+    for i in range(0, len(lat), chunk_size):
+        yield lat[i:i+chunk_size], lon[i:i+chunk_size]
+
+
+def iter_gpx(path, chunk_size=65536):
+    """
+    Incrementally reads the track and route points of a GPX file.
+    
+    Parameters
+    ----------
+    path : str
+        Path to the GPX file.
+    chunk_size : int
+        Maximum number of points in each chunk.
+    
+    Yields
+    ------
+    tuple
+        Arrays of latitude and longitude of each chunk of points.
+    """
+    import xml.etree.ElementTree as ET
+    
+    lat = np.empty(chunk_size)
+    lon = np.empty(chunk_size)
+    n = 0
+    container = None
+    
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        tag = elem.tag.rsplit('}', 1)[-1]
+        
+        if event == 'start':
+            if tag in ('trkseg', 'rte'):
+                container = elem
+            continue
+        
+        if tag in ('trkpt', 'rtept'):
+            lat[n] = float(elem.attrib['lat'])
+            lon[n] = float(elem.attrib['lon'])
+            n += 1
+            
+            # Discard parsed points so memory use does not grow with the file
+            if container is not None:
+                del container[:]
+            
+            if n == chunk_size:
+                yield lat.copy(), lon.copy()
+                n = 0
+    
+    if n > 0:
+        yield lat[:n].copy(), lon[:n].copy()
+
+
+def iter_kml(path, chunk_size=65536):
+    """
+    Incrementally reads the LineString coordinates and gx:Track coordinates
+    of a KML file. Multiple lines are read one after another.
+    
+    Parameters
+    ----------
+    path : str
+        Path to the KML file.
+    chunk_size : int
+        Maximum number of points in each chunk.
+    
+    Yields
+    ------
+    tuple
+        Arrays of latitude and longitude of each chunk of points.
+    """
+    import xml.etree.ElementTree as ET
+    
+    lat = np.empty(chunk_size)
+    lon = np.empty(chunk_size)
+    n = 0
+    
+    for _, elem in ET.iterparse(path, events=('end',)):
+        tag = elem.tag.rsplit('}', 1)[-1]
+        
+        if tag == 'coordinates' and elem.text and elem.text.strip():
+            # Whitespace separated tuples of lon,lat[,alt], parsed by numpy
+            # without building a Python string for each value
+            first = re.match(r'\s*(\S+)', elem.text).group(1)
+            width = first.count(',') + 1
+            values = np.fromstring(elem.text.replace(',', ' '), sep=' ')
+            values = values.reshape(-1, width)
+            
+            if n > 0:
+                yield lat[:n].copy(), lon[:n].copy()
+                n = 0
+            yield from _chunks(values[:, 1], values[:, 0], chunk_size)
+            
+        elif tag == 'coord' and elem.text:
+            # Space separated lon lat alt
+            values = elem.text.split()
+            lat[n] = float(values[1])
+            lon[n] = float(values[0])
+            n += 1
+            
+            if n == chunk_size:
+                yield lat.copy(), lon.copy()
+                n = 0
+        
+        elem.clear()
+    
+    if n > 0:
+        yield lat[:n].copy(), lon[:n].copy()
+
+
+def iter_csv(path, chunk_size=65536, lat_col='lat', lon_col='lon',
+             delimiter=','):
+    """
+    Incrementally reads the coordinates of a CSV file with a header row.
+    
+    Parameters
+    ----------
+    path : str
+        Path to the CSV file.
+    chunk_size : int
+        Maximum number of points in each chunk.
+    lat_col : str
+        Name of the latitude column.
+    lon_col : str
+        Name of the longitude column.
+    delimiter : str
+        Column delimiter.
+    
+    Yields
+    ------
+    tuple
+        Arrays of latitude and longitude of each chunk of points.
+    """
+    import csv
+    
+    lat = np.empty(chunk_size)
+    lon = np.empty(chunk_size)
+    n = 0
+    
+    with open(path, newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = [col.strip() for col in next(reader)]
+        lat_idx = header.index(lat_col)
+        lon_idx = header.index(lon_col)
+        
+        for row in reader:
+            if not row:
+                continue
+            lat[n] = float(row[lat_idx])
+            lon[n] = float(row[lon_idx])
+            n += 1
+            
+            if n == chunk_size:
+                yield lat.copy(), lon.copy()
+                n = 0
+    
+    if n > 0:
+        yield lat[:n].copy(), lon[:n].copy()
+
+
+def douglas_peucker(lat, lon, tolerance):
+    """
+    Simplifies a line with the Douglas-Peucker algorithm.
+    
+    Parameters
+    ----------
+    lat : numpy.ndarray
+        Latitude of each point in degrees.
+    lon : numpy.ndarray
+        Longitude of each point in degrees.
+    tolerance : float
+        Maximum distance in metres between the line and the simplified line.
+    
+    Returns
+    -------
+    numpy.ndarray
+        Boolean mask of the points kept. The first and last points are always
+        kept.
+    """
+    
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    
+    x, y = enu(lat, lon, np.mean(lat), np.mean(lon))
+    stack = [(0, n - 1)]
+    
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        
+        # Perpendicular distance of the interior points from the chord
+        dx = x[end] - x[start]
+        dy = y[end] - y[start]
+        px = x[start+1:end] - x[start]
+        py = y[start+1:end] - y[start]
+        length = np.hypot(dx, dy)
+        if length > 0:
+            dist = np.abs(dx*py - dy*px)/length
+        else:
+            dist = np.hypot(px, py)
+        
+        i = np.argmax(dist)
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    
+    return keep
+
+
+def coords2route(coords, tolerance=None, chunk_size=65536):
+    """
+    Builds a compact route from coordinates, for use with paths.route_lat and
+    paths.route_lon.
+    
+    Parameters
+    ----------
+    coords : list / numpy.ndarray / iterator
+        Sequence of (latitude, longitude) pairs, or an iterator of
+        (latitude array, longitude array) chunks such as those yielded by
+        iter_gpx, iter_kml or iter_csv.
+    tolerance : float
+        If given, each chunk is simplified with the Douglas-Peucker algorithm
+        to within tolerance metres. Chunk boundaries are always kept.
+    chunk_size : int
+        Number of points per batch when coords is a sequence of pairs.
+    
+    Returns
+    -------
+    dict
+        Dictionary of the route:
+        - lat: Latitude of each point of the route
+        - lon: Longitude of each point of the route
+        - dist: Distance along the route at each point
+        - azi: Azimuth of each segment joining successive points
+    """
+    
+    if isinstance(coords, (list, tuple, np.ndarray)):
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        chunks = _chunks(coords[:, 0], coords[:, 1], chunk_size)
+    else:
+        chunks = coords
+    
+    lats = []
+    lons = []
+    lengths = []
+    azis = []
+    
+    for lat, lon in chunks:
+        if len(lat) == 0:
+            continue
+        
+        # Join each chunk to the last point of the previous one
+        if lats:
+            lat = np.concatenate(([lats[-1][-1]], lat))
+            lon = np.concatenate(([lons[-1][-1]], lon))
+        
+        if tolerance is not None:
+            keep = douglas_peucker(lat, lon, tolerance)
+            lat = lat[keep]
+            lon = lon[keep]
+        
+        s, azi = segments(lat, lon)
+        lengths.append(s)
+        azis.append(azi)
+        
+        if lats:
+            lat = lat[1:]
+            lon = lon[1:]
+        lats.append(lat)
+        lons.append(lon)
+    
+    if not lats:
+        return {'lat': np.empty(0), 'lon': np.empty(0), 'dist': np.empty(0),
+                'azi': np.empty(0)}
+    
+    lengths = np.concatenate(lengths)
+    
+    return {'lat': np.concatenate(lats),
+            'lon': np.concatenate(lons),
+            'dist': np.concatenate(([0.], np.cumsum(lengths))),
+            'azi': np.concatenate(azis)}
+
+
+def load_route(path, fmt=None, tolerance=None, chunk_size=65536, **kwargs):
+    """
+    Streams a GPX, KML or CSV file into a compact route, for use with
+    paths.route_lat and paths.route_lon.
+    
+    Parameters
+    ----------
+    path : str
+        Path to the route file.
+    fmt : str
+        One of 'gpx', 'kml' or 'csv'. Taken from the file extension if None.
+    tolerance : float
+        If given, the route is simplified with the Douglas-Peucker algorithm
+        to within tolerance metres.
+    chunk_size : int
+        Number of points parsed and processed per batch.
+    **kwargs
+        Passed on to iter_csv.
+    
+    Returns
+    -------
+    dict
+        Dictionary of the route, as returned by coords2route.
+    """
+    import os
+    
+    if fmt is None:
+        fmt = os.path.splitext(path)[1][1:]
+    fmt = fmt.lower()
+    
+    if fmt == 'gpx':
+        chunks = iter_gpx(path, chunk_size)
+    elif fmt == 'kml':
+        chunks = iter_kml(path, chunk_size)
+    elif fmt == 'csv':
+        chunks = iter_csv(path, chunk_size, **kwargs)
+    else:
+        raise ValueError("fmt must be one of 'gpx', 'kml' or 'csv'.")
+    
+    return coords2route(chunks, tolerance=tolerance)
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+""" Detection of encounters between simulated characters """
+
+import numpy as np
+
+from .geometry import ecef
+
+# Large primes used to hash integer grid cells into a single key
+_HASH_PRIMES = (73856093, 19349663, 83492791)
+
+# Half of the 27 cell neighbourhood, so that each pair of adjacent cells is
+# only visited once
+_HALF_OFFSETS = np.array([(dx, dy, dz)
+                          for dx in (-1, 0, 1)
+                          for dy in (-1, 0, 1)
+                          for dz in (-1, 0, 1)
+                          if (dx, dy, dz) >= (0, 0, 0)], dtype=np.int64)
+
+
+def _hash_cells(cells):
+    """ Hashes an (n, 3) array of integer grid cells to int64 keys """
+    return ((cells[:, 0]*_HASH_PRIMES[0])
+            ^ (cells[:, 1]*_HASH_PRIMES[1])
+            ^ (cells[:, 2]*_HASH_PRIMES[2]))
+
+
+def close_pairs(xyz, radius):
+    """
+    Finds all pairs of points that are within radius of each other.
+
+    Points are bucketed into a hashed grid of cubes with side radius, so only
+    points in neighbouring cells are compared. Hash collisions only add
+    candidates, which are discarded by the final distance check.
+
+    Parameters
+    ----------
+    xyz : numpy.ndarray
+        Array of shape (n, 3) of ECEF coordinates in metres.
+    radius : float
+        Separation in metres below which two points are considered close.
+
+    Returns
+    -------
+    tuple
+        Arrays i, j and dist, where i < j are the indices of each close pair
+        and dist is their straight line separation in metres.
+    """
+
+    n = len(xyz)
+    if n < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+
+    cells = np.floor(xyz/radius).astype(np.int64)
+    keys = _hash_cells(cells)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    pairs = []
+    for offset in _HALF_OFFSETS:
+        neighbour_keys = _hash_cells(cells + offset)
+        lo = np.searchsorted(sorted_keys, neighbour_keys, side='left')
+        hi = np.searchsorted(sorted_keys, neighbour_keys, side='right')
+        counts = hi - lo
+        total = counts.sum()
+        if total == 0:
+            continue
+
+        # Expand each point against every point in its neighbouring cell
+        i = np.repeat(np.arange(n), counts)
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts,
+                                              counts)
+        j = order[np.repeat(lo, counts) + within]
+
+        keep = i != j
+        pairs.append(np.minimum(i[keep], j[keep])*n
+                     + np.maximum(i[keep], j[keep]))
+
+    if not pairs:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+
+    codes = np.unique(np.concatenate(pairs))
+    i = codes // n
+    j = codes % n
+    dist = np.linalg.norm(xyz[i] - xyz[j], axis=1)
+    close = dist <= radius
+
+    return i[close], j[close], dist[close]
+
+
+class EncounterDetector:
+    """
+    Attributes
+    ----------
+    radius : float
+        Separation in metres below which two characters are encountering
+        each other.
+    encounters : list
+        List of dictionaries of the finished encounters:
+        - name1: Identifier of the first character
+        - name2: Identifier of the second character
+        - start: Time of the first fix within radius
+        - end: Time of the last fix within radius
+        - min_dist: Smallest separation in metres during the encounter
+
+    Methods
+    -------
+
+    __init__(radius):
+        Constructs all the attributes for the EncounterDetector object.
+
+    update(t, names, lat, lon):
+        Adds the fixes of every character at a single time slice.
+
+    close():
+        Finishes all ongoing encounters and returns the encounters list.
+    """
+
+    def __init__(self, radius):
+        """
+        Constructs all the attributes for the EncounterDetector object.
+
+        Parameters
+        ----------
+        radius : float
+            Separation in metres below which two characters are encountering
+            each other.
+        """
+
+        self.radius = radius
+        self.encounters = []
+
+        self._ids = {}
+        self._names = []
+        self._open = {}
+        self._last_names = None
+        self._last_ids = None
+
+    def _lookup(self, names):
+        """ Maps character identifiers to integer ids """
+
+        # Fixed fleets usually pass the same names every slice. The names
+        # are compared by value, as a caller may reuse and modify one list
+        names = tuple(names)
+        if names == self._last_names:
+            return self._last_ids
+
+        ids = np.empty(len(names), dtype=np.int64)
+        for idx, name in enumerate(names):
+            if name not in self._ids:
+                self._ids[name] = len(self._names)
+                self._names.append(name)
+            ids[idx] = self._ids[name]
+
+        self._last_names = names
+        self._last_ids = ids
+        return ids
+
+    def _finish(self, code, state):
+        """ Moves an open encounter to the encounters list """
+        self.encounters.append({'name1': self._names[code >> 32],
+                                'name2': self._names[code & 0xffffffff],
+                                'start': state[0],
+                                'end': state[1],
+                                'min_dist': state[2]})
+
+    def update(self, t, names, lat, lon):
+        """
+        Adds the fixes of every character at a single time slice.
+
+        Parameters
+        ----------
+        t : datetime.datetime / float / int
+            Time of the slice.
+        names : list
+            Hashable identifiers of the characters in the slice.
+        lat : array_like
+            Latitude of each character.
+        lon : array_like
+            Longitude of each character.
+        """
+
+        ids = self._lookup(names)
+        i, j, dist = close_pairs(ecef(lat, lon), self.radius)
+
+        a = np.minimum(ids[i], ids[j])
+        b = np.maximum(ids[i], ids[j])
+        codes = (a << 32) | b
+
+        current = {}
+        for code, d in zip(codes.tolist(), dist.tolist()):
+            state = self._open.get(code)
+            if state is None:
+                current[code] = [t, t, d]
+            else:
+                state[1] = t
+                state[2] = min(state[2], d)
+                current[code] = state
+
+        for code, state in self._open.items():
+            if code not in current:
+                self._finish(code, state)
+
+        self._open = current
+
+    def close(self):
+        """
+        Finishes all ongoing encounters and returns the encounters list.
+
+        Returns
+        -------
+        list
+            List of dictionaries of every encounter detected.
+        """
+
+        for code, state in self._open.items():
+            self._finish(code, state)
+        self._open = {}
+
+        return self.encounters
+
+
+def find_encounters(results, radius):
+    """
+    Finds every pair of characters that came within radius of each other,
+    and when.
+
+    Parameters
+    ----------
+    results : list
+        List of dictionaries of results returned by Simulation.run_threaded,
+        all sharing the same time increments.
+    radius : float
+        Separation in metres below which two characters are encountering
+        each other.
+
+    Returns
+    -------
+    list
+        List of dictionaries of every encounter, ordered by end time:
+        - name1: Name of the first character
+        - name2: Name of the second character
+        - index1: Index of the first character in results
+        - index2: Index of the second character in results
+        - start: dtime of the first fix within radius
+        - end: dtime of the last fix within radius
+        - min_dist: Smallest separation in metres during the encounter
+    """
+
+    if len({len(result['lat']) for result in results}) > 1:
+        raise ValueError("All results must share the same time increments.")
+
+    if not results:
+        return []
+
+    lat = np.asarray([result['lat'] for result in results], dtype=float)
+    lon = np.asarray([result['lon'] for result in results], dtype=float)
+    indices = list(range(len(results)))
+
+    detector = EncounterDetector(radius)
+    for idx, t in enumerate(results[0]['dtime']):
+        detector.update(t, indices, lat[:, idx], lon[:, idx])
+
+    encounters = detector.close()
+    for encounter in encounters:
+        encounter['index1'] = encounter['name1']
+        encounter['index2'] = encounter['name2']
+        encounter['name1'] = results[encounter['index1']]['name']
+        encounter['name2'] = results[encounter['index2']]['name']
+
+    return encounters
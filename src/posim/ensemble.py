@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+""" Monte Carlo ensembles of a Character folded into online statistics """
+
+import concurrent.futures
+import copy
+import os
+
+import numpy as np
+
+from . import noise, paths, velocities
+from .geometry import enu
+from .rng import derive_seed
+
+
+class EnsembleStats:
+    """
+    Attributes
+    ----------
+    reference : dict
+        Results that the position error of each replica is measured from.
+    count : int
+        Number of replicas folded in.
+    edges : numpy.ndarray
+        Edges in metres of the position error histogram bins.
+
+    Methods
+    -------
+
+    __init__(reference, min_error, max_error, bins):
+        Constructs all the attributes for the EnsembleStats object.
+
+    update(result):
+        Folds the results of a replica into the statistics.
+
+    percentile(q):
+        Estimates a percentile of the position error at each timestep.
+
+    summary(percentiles):
+        Returns the statistics at each timestep.
+    """
+
+    def __init__(self, reference, min_error=1e-3, max_error=1e5, bins=128):
+        """
+        Constructs all the attributes for the EnsembleStats object.
+
+        Parameters
+        ----------
+        reference : dict
+            Results that the position error of each replica is measured from.
+        min_error : float
+            Upper edge in metres of the lowest histogram bin.
+        max_error : float
+            Lower edge in metres of the highest histogram bin.
+        bins : int
+            Number of logarithmically spaced histogram bins between min_error
+            and max_error, which sets the resolution of the percentiles. The
+            default of 128 bins spans 8 decades with about 16 bins each.
+        """
+
+        self.reference = reference
+        self.count = 0
+        self.edges = np.geomspace(min_error, max_error, bins + 1)
+
+        self._ref_lat = np.asarray(reference['lat'], dtype=float)
+        self._ref_lon = np.asarray(reference['lon'], dtype=float)
+        n = len(self._ref_lat)
+
+        # Welford accumulators of the east and north offsets and the error
+        self._mean = np.zeros((3, n))
+        self._m2 = np.zeros((3, n))
+        self._min = np.full(n, np.inf)
+        self._max = np.full(n, -np.inf)
+
+        # Histogram of the error at each timestep, with under and overflow
+        self._hist = np.zeros((n, bins + 2), dtype=np.uint32)
+
+    def update(self, result):
+        """
+        Folds the results of a replica into the statistics.
+
+        Parameters
+        ----------
+        result : dict
+            Dictionary of results returned by Simulation.run_sim, with the
+            same time increments as the reference.
+        """
+
+        east, north = enu(result['lat'], result['lon'], self._ref_lat,
+                          self._ref_lon)
+        values = np.stack([east, north, np.hypot(east, north)])
+
+        self.count += 1
+        delta = values - self._mean
+        self._mean += delta/self.count
+        self._m2 += delta*(values - self._mean)
+
+        error = values[2]
+        np.minimum(self._min, error, out=self._min)
+        np.maximum(self._max, error, out=self._max)
+
+        idx = np.searchsorted(self.edges, error, side='right')
+        self._hist[np.arange(len(error)), idx] += 1
+
+    def percentile(self, q):
+        """
+        Estimates a percentile of the position error at each timestep, by
+        geometric interpolation within the histogram bin holding it.
+
+        Parameters
+        ----------
+        q : float
+            Percentile between 0 and 100.
+
+        Returns
+        -------
+        numpy.ndarray
+            Estimated position error in metres at each timestep.
+        """
+
+        return self._percentiles([q])[0]
+
+    def _percentiles(self, qs):
+        """ Estimates several percentiles from a single cumulative histogram """
+
+        if self.count == 0:
+            return [np.full(len(self._hist), np.nan) for q in qs]
+
+        cum = np.cumsum(self._hist, axis=1, dtype=np.uint32)
+        rows = np.arange(len(cum))
+
+        # Under and overflow bins are bounded by the exact extremes
+        lower = np.concatenate(([0.], self.edges))
+        upper = np.concatenate((self.edges, [np.inf]))
+
+        values = []
+        for q in qs:
+            target = q/100.*self.count
+            idx = np.minimum((cum < target).sum(axis=1), cum.shape[1] - 1)
+
+            below = np.where(idx > 0, cum[rows, np.maximum(idx - 1, 0)], 0)
+            frac = (target - below)/np.maximum(self._hist[rows, idx], 1)
+            frac = np.clip(frac, 0., 1.)
+
+            lo = np.maximum(lower[idx], self._min)
+            hi = np.minimum(upper[idx], self._max)
+            hi = np.maximum(hi, lo)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values.append(np.where(lo > 0, lo*(hi/lo)**frac,
+                                       lo + (hi - lo)*frac))
+
+        return values
+
+    def summary(self, percentiles=(5, 50, 95)):
+        """
+        Returns the statistics at each timestep.
+
+        Parameters
+        ----------
+        percentiles : tuple
+            Percentiles of the position error to estimate.
+
+        Returns
+        -------
+        dict
+            Dictionary of the statistics:
+            - count: Number of replicas
+            - dtime: Datetime / numeric time at each time increment
+            - stime: Total time elapsed since the start of the simulation
+            - mean_east, mean_north: Mean offset in metres from the reference
+            - var_east, var_north: Sample variance of the offsets in m^2
+            - mean_error: Mean distance in metres from the reference
+            - var_error: Sample variance of the distance in m^2
+            - min_error, max_error: Extremes of the distance in metres
+            - percentiles: Dictionary of the estimated distance in metres at
+              each percentile
+        """
+
+        ddof = max(self.count - 1, 1)
+        var = self._m2/ddof
+
+        return {'count': self.count,
+                'dtime': self.reference['dtime'],
+                'stime': self.reference['stime'],
+                'mean_east': self._mean[0],
+                'mean_north': self._mean[1],
+                'var_east': var[0],
+                'var_north': var[1],
+                'mean_error': self._mean[2],
+                'var_error': var[2],
+                'min_error': self._min,
+                'max_error': self._max,
+                'percentiles': dict(zip(percentiles,
+                                        self._percentiles(percentiles)))}
+
+
+def run_ensemble(sim, char, n, seed=0, reference=None, max_workers=None,
+                 percentiles=(5, 50, 95), **kwargs):
+    """
+    Runs n seeded replicas of a Character in seperate threads and folds each
+    into online statistics as it finishes, so memory does not grow with n.
+
+    Parameters
+    ----------
+    sim : Simulation
+        Simulation to run the replicas with.
+    char : Character
+        Instance of the Character class.
+    n : int
+        Number of replicas.
+    seed : int
+        Seed from which the seed of each replica is derived.
+    reference : dict
+        Results that the position error is measured from. Defaults to a run
+        of char with its noise functions removed, seeded with seed. The
+        replicas are seeded differently, so the default is only meaningful
+        when the path and velocity are deterministic, and a reference must
+        be given if they use velocities.random or paths.random. Other
+        functions drawing random numbers are not detected.
+    max_workers : int
+        Number of threads. Defaults to the ThreadPoolExecutor default.
+    percentiles : tuple
+        Percentiles of the position error to estimate.
+    **kwargs
+        Histogram options passed on to EnsembleStats.
+
+    Returns
+    -------
+    dict
+        Dictionary of the statistics, as returned by EnsembleStats.summary.
+    """
+
+    if reference is None:
+        if (char.velocity_func is velocities.random
+                or paths.random in (char.lat_func, char.lon_func)):
+            raise ValueError("A reference is required when the velocity or "
+                             "path functions are random.")
+        clean = copy.copy(char)
+        clean.lat_noise = noise.no_noise
+        clean.lon_noise = noise.no_noise
+        reference = sim.run_sim(clean, seed)
+
+    stats = EnsembleStats(reference, **kwargs)
+
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) + 4)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        # Bound the replicas in flight so finished results are released
+        limit = 2*max_workers
+        pending = set()
+
+        for k in range(n):
+            pending.add(executor.submit(sim.run_sim, char,
+                                        derive_seed(seed, k)))
+            if len(pending) >= limit:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    stats.update(future.result())
+
+        for future in concurrent.futures.as_completed(pending):
+            stats.update(future.result())
+
+    return stats.summary(percentiles)
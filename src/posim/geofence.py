@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+""" Geofence containment tests and enter/exit events for simulated tracks """
+
+import numpy as np
+
+# Largest number of point and edge combinations tested at once
+_MAX_BLOCK = 1 << 20
+
+
+class Geofences:
+    """
+    Attributes
+    ----------
+    names : list
+        Name of each geofence.
+    cell_size : float
+        Size in degrees of the grid cells used to index the geofences.
+    max_cells : int
+        Largest number of grid cells a geofence is indexed in.
+
+    Methods
+    -------
+
+    __init__(polygons, names, cell_size, max_cells):
+        Constructs all the attributes and the index of the Geofences object.
+
+    contains(lat, lon):
+        Finds every geofence containing each point.
+    """
+
+    def __init__(self, polygons, names=None, cell_size=None, max_cells=1024):
+        """
+        Constructs all the attributes and the index of the Geofences object.
+
+        Parameters
+        ----------
+        polygons : list
+            List of polygons, each a list of (latitude, longitude) vertices.
+            Polygons are treated as planar in latitude and longitude and must
+            not cross the antimeridian.
+        names : list
+            Name of each geofence. Defaults to the index of each polygon.
+        cell_size : float
+            Size in degrees of the grid cells used to index the geofences.
+            Defaults to the median extent of the geofences.
+        max_cells : int
+            Largest number of grid cells a geofence is indexed in. Geofences
+            covering more cells are instead checked against every point, so
+            a few large geofences among many small ones stay cheap to index.
+        """
+
+        if names is None:
+            names = list(range(len(polygons)))
+        self.names = list(names)
+
+        # Edges of each polygon as closed rings of (lat, lon) vertices
+        self._rings = [np.asarray(polygon, dtype=float).reshape(-1, 2)
+                       for polygon in polygons]
+        self._bbox = np.array([np.concatenate([ring.min(axis=0),
+                                               ring.max(axis=0)])
+                               for ring in self._rings]).reshape(-1, 4)
+
+        if cell_size is None:
+            extents = np.maximum(self._bbox[:, 2] - self._bbox[:, 0],
+                                 self._bbox[:, 3] - self._bbox[:, 1])
+            cell_size = float(np.median(extents)) if len(extents) else 1.
+            cell_size = cell_size if cell_size > 0 else 1e-3
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+
+        self._build_index()
+
+    def _cells(self, lat, lon):
+        """ Returns the grid row and column of each coordinate """
+        rows = np.floor((np.asarray(lat) + 90.)/self.cell_size)
+        cols = np.floor((np.asarray(lon) + 180.)/self.cell_size)
+        return rows.astype(np.int64), cols.astype(np.int64)
+
+    def _build_index(self):
+        """ Lists the geofences overlapping each grid cell """
+
+        self._n_cols = int(np.ceil(360./self.cell_size)) + 1
+
+        i0, j0 = self._cells(self._bbox[:, 0], self._bbox[:, 1])
+        i1, j1 = self._cells(self._bbox[:, 2], self._bbox[:, 3])
+        n_cells = (i1 - i0 + 1)*(j1 - j0 + 1)
+
+        # Geofences too large for the grid are checked against every point
+        self._large = np.flatnonzero(n_cells > self.max_cells)
+
+        keys = []
+        fences = []
+        for fence in np.flatnonzero(n_cells <= self.max_cells):
+            rows, cols = np.meshgrid(np.arange(i0[fence], i1[fence] + 1),
+                                     np.arange(j0[fence], j1[fence] + 1))
+            keys.append((rows*self._n_cols + cols).ravel())
+            fences.append(np.full(rows.size, fence))
+
+        if keys:
+            keys = np.concatenate(keys)
+            fences = np.concatenate(fences)
+        else:
+            keys = np.empty(0, dtype=np.int64)
+            fences = np.empty(0, dtype=np.int64)
+
+        order = np.argsort(keys, kind='stable')
+        self._cell_keys = keys[order]
+        self._cell_fences = fences[order]
+
+    def contains(self, lat, lon):
+        """
+        Finds every geofence containing each point.
+
+        Parameters
+        ----------
+        lat : array_like
+            Latitude of each point.
+        lon : array_like
+            Longitude of each point.
+
+        Returns
+        -------
+        tuple
+            Arrays of point and geofence indices of every point inside a
+            geofence, ordered by geofence and then by point.
+        """
+
+        lat = np.asarray(lat, dtype=float).ravel()
+        lon = np.asarray(lon, dtype=float).ravel()
+
+        # Candidate geofences from the grid cell of each point
+        rows, cols = self._cells(lat, lon)
+        keys = rows*self._n_cols + cols
+        lo = np.searchsorted(self._cell_keys, keys, side='left')
+        hi = np.searchsorted(self._cell_keys, keys, side='right')
+        counts = hi - lo
+        total = counts.sum()
+
+        points = np.repeat(np.arange(len(lat)), counts)
+        within = np.arange(total) - np.repeat(np.cumsum(counts) - counts,
+                                              counts)
+        fences = self._cell_fences[np.repeat(lo, counts) + within]
+
+        # Candidates of the geofences too large for the grid
+        points = [points]
+        fences = [fences]
+        for fence in self._large:
+            bbox = self._bbox[fence]
+            inside = np.flatnonzero((lat >= bbox[0]) & (lat <= bbox[2])
+                                    & (lon >= bbox[1]) & (lon <= bbox[3]))
+            points.append(inside)
+            fences.append(np.full(len(inside), fence))
+        points = np.concatenate(points)
+        fences = np.concatenate(fences)
+
+        # Bounding box rejection
+        bbox = self._bbox[fences]
+        keep = ((lat[points] >= bbox[:, 0]) & (lat[points] <= bbox[:, 2])
+                & (lon[points] >= bbox[:, 1]) & (lon[points] <= bbox[:, 3]))
+        points = points[keep]
+        fences = fences[keep]
+
+        order = np.lexsort((points, fences))
+        points = points[order]
+        fences = fences[order]
+
+        # Ray casting for the candidates of each geofence
+        inside = np.zeros(len(points), dtype=bool)
+        bounds = np.flatnonzero(np.diff(fences)) + 1
+        for start, end in zip(np.concatenate(([0], bounds)),
+                              np.concatenate((bounds, [len(points)]))):
+            if start == end:
+                continue
+            ring = self._rings[fences[start]]
+            inside[start:end] = _in_ring(ring, lat[points[start:end]],
+                                         lon[points[start:end]])
+
+        return points[inside], fences[inside]
+
+
+def _in_ring(ring, lat, lon):
+    """ Even-odd ray casting test of points against a polygon ring """
+
+    y1 = ring[:, 0]
+    x1 = ring[:, 1]
+    y2 = np.roll(y1, -1)
+    x2 = np.roll(x1, -1)
+
+    # Horizontal edges never cross the ray
+    dy = y2 - y1
+    slope = np.divide(x2 - x1, dy, out=np.zeros_like(dy), where=dy != 0)
+
+    inside = np.zeros(len(lat), dtype=bool)
+    block = max(1, _MAX_BLOCK//len(ring))
+
+    for start in range(0, len(lat), block):
+        py = lat[start:start+block, None]
+        px = lon[start:start+block, None]
+        crosses = (y1 > py) != (y2 > py)
+        x_int = x1 + (py - y1)*slope
+        inside[start:start+block] = np.logical_xor.reduce(
+            crosses & (px < x_int), axis=1)
+
+    return inside
+
+
+class GeofenceMonitor:
+    """
+    Attributes
+    ----------
+    fences : Geofences
+        Geofences to monitor.
+    events : list
+        List of dictionaries of every event, ordered by character and time:
+        - name: Identifier of the character
+        - fence: Name of the geofence
+        - event: Either 'enter' or 'exit'
+        - time: Time of the first fix inside or outside the geofence
+
+    Methods
+    -------
+
+    __init__(fences):
+        Constructs all the attributes for the GeofenceMonitor object.
+
+    update(name, t, lat, lon):
+        Adds the next chunk of fixes of a character.
+    """
+
+    def __init__(self, fences):
+        """
+        Constructs all the attributes for the GeofenceMonitor object.
+
+        Parameters
+        ----------
+        fences : Geofences
+            Geofences to monitor.
+        """
+
+        self.fences = fences
+        self.events = []
+
+        # Geofences containing the last fix of each character
+        self._inside = {}
+
+    def update(self, name, t, lat, lon):
+        """
+        Adds the next chunk of fixes of a character.
+
+        Parameters
+        ----------
+        name : hashable
+            Identifier of the character.
+        t : list
+            Time of each fix.
+        lat : array_like
+            Latitude of each fix.
+        lon : array_like
+            Longitude of each fix.
+
+        Returns
+        -------
+        list
+            List of dictionaries of the events found in the chunk.
+        """
+
+        n = len(t)
+        if n == 0:
+            return []
+
+        points, fences = self.fences.contains(lat, lon)
+        previous = self._inside.get(name, set())
+
+        # Runs of consecutive fixes inside the same geofence
+        new_fence = np.ones(len(points), dtype=bool)
+        new_fence[1:] = fences[1:] != fences[:-1]
+        starts = new_fence.copy()
+        starts[1:] |= points[1:] != points[:-1] + 1
+        ends = np.roll(starts, -1)
+        if len(ends):
+            ends[-1] = True
+
+        events = []
+        continued = set()
+
+        for point, fence in zip(points[starts].tolist(),
+                                fences[starts].tolist()):
+            if point == 0 and fence in previous:
+                continued.add(fence)
+            else:
+                events.append((point, fence, 'enter'))
+
+        inside = set()
+        for point, fence in zip(points[ends].tolist(),
+                                fences[ends].tolist()):
+            if point == n - 1:
+                inside.add(fence)
+            else:
+                events.append((point + 1, fence, 'exit'))
+
+        for fence in previous - continued:
+            events.append((0, fence, 'exit'))
+
+        self._inside[name] = inside
+
+        events.sort(key=lambda event: (event[0], event[2] == 'enter'))
+        events = [{'name': name, 'fence': self.fences.names[fence],
+                   'event': kind, 'time': t[point]}
+                  for point, fence, kind in events]
+        self.events.extend(events)
+
+        return events
+
+
+def find_events(fences, results):
+    """
+    Finds the enter and exit events of every character and geofence.
+
+    Parameters
+    ----------
+    fences : Geofences
+        Geofences to test the results against.
+    results : list / dict
+        Dictionary or list of dictionaries of results returned by
+        Simulation.run_sim or Simulation.run_threaded methods.
+
+    Returns
+    -------
+    list
+        List of dictionaries of every event, ordered by character and time:
+        - name: Name of the character
+        - index: Index of the character in results
+        - fence: Name of the geofence
+        - event: Either 'enter' or 'exit'
+        - time: dtime of the first fix inside or outside the geofence
+    """
+
+    if not isinstance(results, list):
+        results = [results]
+
+    monitor = GeofenceMonitor(fences)
+    for idx, result in enumerate(results):
+        monitor.update(idx, result['dtime'], result['lat'], result['lon'])
+
+    for event in monitor.events:
+        event['index'] = event['name']
+        event['name'] = results[event['index']]['name']
+
+    return monitor.events
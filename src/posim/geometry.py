@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+""" Vectorised coordinate helpers shared by the analysis modules """
+
+import numpy as np
+
+# WGS84 ellipsoid constants
+WGS84_A = 6378137.
+WGS84_F = 1/298.257223563
+WGS84_E2 = WGS84_F*(2 - WGS84_F)
+
+
+def ecef(lat, lon, h=0.):
+    """
+    Converts geodetic coordinates to Earth-centred, Earth-fixed coordinates.
+
+    Parameters
+    ----------
+    lat : array_like
+        Latitude in degrees.
+    lon : array_like
+        Longitude in degrees.
+    h : array_like
+        Height above the WGS84 ellipsoid in metres.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape (..., 3) of X, Y and Z coordinates in metres.
+    """
+
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    sin_lat = np.sin(lat)
+    cos_lat = np.cos(lat)
+
+    # Prime vertical radius of curvature
+    n = WGS84_A/np.sqrt(1 - WGS84_E2*sin_lat**2)
+
+    return np.stack([(n + h)*cos_lat*np.cos(lon),
+                     (n + h)*cos_lat*np.sin(lon),
+                     (n*(1 - WGS84_E2) + h)*sin_lat], axis=-1)
+
+
+def radii(lat):
+    """
+    Returns the meridional and prime vertical radii of curvature.
+
+    Parameters
+    ----------
+    lat : array_like
+        Latitude in degrees.
+
+    Returns
+    -------
+    tuple
+        Meridional and prime vertical radii of curvature in metres.
+    """
+
+    sin2 = np.sin(np.radians(np.asarray(lat, dtype=float)))**2
+    w = np.sqrt(1 - WGS84_E2*sin2)
+
+    return WGS84_A*(1 - WGS84_E2)/w**3, WGS84_A/w
+
+
+def enu(lat, lon, lat0, lon0):
+    """
+    Projects coordinates onto the local tangent plane at (lat0, lon0).
+
+    Accurate to well under a metre within a few tens of kilometres of the
+    origin, which covers the extent of a typical simulated track.
+
+    Parameters
+    ----------
+    lat : array_like
+        Latitude in degrees.
+    lon : array_like
+        Longitude in degrees.
+    lat0 : float
+        Latitude of the origin in degrees.
+    lon0 : float
+        Longitude of the origin in degrees.
+
+    Returns
+    -------
+    tuple
+        East and north offsets from the origin in metres.
+    """
+
+    m, n = radii(lat0)
+    dlat = np.radians(np.asarray(lat, dtype=float) - lat0)
+    dlon = np.radians((np.asarray(lon, dtype=float) - lon0 + 180.) % 360.
+                      - 180.)
+
+    return n*np.cos(np.radians(lat0))*dlon, m*dlat
+
+
+def segments(lat, lon):
+    """
+    Returns the length and azimuth of each segment joining successive points.
+
+    Uses the mid-latitude approximation on the WGS84 ellipsoid, which agrees
+    with geographiclib's Inverse to within a few parts per million for the
+    segment lengths found in recorded or hand-picked routes.
+
+    Parameters
+    ----------
+    lat : array_like
+        Latitude of each point in degrees.
+    lon : array_like
+        Longitude of each point in degrees.
+
+    Returns
+    -------
+    tuple
+        Arrays of segment lengths in metres and azimuths in degrees, each one
+        element shorter than lat and lon.
+    """
+
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+
+    lat_mid = (lat[1:] + lat[:-1])/2
+    m, n = radii(lat_mid)
+    dlat = np.radians(np.diff(lat))
+    dlon = np.radians((np.diff(lon) + 180.) % 360. - 180.)
+
+    north = m*dlat
+    east = n*np.cos(np.radians(lat_mid))*dlon
+
+    return np.hypot(east, north), np.degrees(np.arctan2(east, north))
+
+
+def azimuth(x, y):
+    """
+    Returns the azimuth of direction vectors, following the convention used
+    by Simulation.run_sim.
+
+    Parameters
+    ----------
+    x : array_like
+        X component of the direction vector.
+    y : array_like
+        Y component of the direction vector.
+
+    Returns
+    -------
+    numpy.ndarray
+        Azimuth in degrees.
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        azi = np.degrees(np.arctan(x/y))
+    azi = np.where(y == 0, np.where(x >= 0, 180., 0.), azi)
+
+    return np.where(y < 0, azi + 180., azi)
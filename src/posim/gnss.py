@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+""" Satellite geometry and pseudoranges observed from simulated positions """
+
+from datetime import datetime
+
+import numpy as np
+
+from .geometry import ecef
+
+# GPS constants from IS-GPS-200
+MU = 3.986005e14
+OMEGA_E = 7.2921151467e-5
+C = 299792458.
+GPS_EPOCH = datetime(1980, 1, 6)
+WEEK_SECONDS = 604800.
+
+# YUMA field labels and the almanac keys they are read into
+_YUMA_FIELDS = {'id': 'prn',
+                'health': 'health',
+                'eccentricity': 'e',
+                'time of applicability(s)': 'toa',
+                'orbital inclination(rad)': 'i0',
+                'rate of right ascen(r/s)': 'omega_dot',
+                'sqrt(a)  (m 1/2)': 'sqrt_a',
+                'right ascen at week(rad)': 'omega0',
+                'argument of perigee(rad)': 'w',
+                'mean anom(rad)': 'm0',
+                'af0(s)': 'af0',
+                'af1(s/s)': 'af1',
+                'week': 'week'}
+
+
+def load_yuma(path):
+    """
+    Reads a GPS almanac in the YUMA format.
+
+    Parameters
+    ----------
+    path : str
+        Path to the YUMA almanac file.
+
+    Returns
+    -------
+    dict
+        Dictionary of arrays of the almanac parameters of each satellite:
+        - prn: PRN number
+        - health: Health code, 0 if healthy
+        - e: Eccentricity
+        - toa: Time of applicability in seconds of the week
+        - i0: Inclination in radians
+        - omega_dot: Rate of right ascension in radians per second
+        - sqrt_a: Square root of the semi-major axis in m^(1/2)
+        - omega0: Right ascension at the start of the week in radians
+        - w: Argument of perigee in radians
+        - m0: Mean anomaly at toa in radians
+        - af0: Clock bias in seconds
+        - af1: Clock drift in seconds per second
+        - week: Week number, modulo 1024
+    """
+
+    columns = {key: [] for key in _YUMA_FIELDS.values()}
+
+    with open(path) as f:
+        for line in f:
+            if ':' not in line:
+                continue
+            label, value = line.split(':', 1)
+            key = _YUMA_FIELDS.get(label.strip().lower())
+            if key is not None:
+                columns[key].append(float(value))
+
+    almanac = {key: np.array(values) for key, values in columns.items()}
+    for key in ['prn', 'health', 'week']:
+        almanac[key] = almanac[key].astype(int)
+
+    return almanac
+
+
+def gps_seconds(dtime, leap_seconds=18):
+    """
+    Converts UTC datetimes to seconds since the GPS epoch.
+
+    Parameters
+    ----------
+    dtime : list
+        List of datetime.datetime.
+    leap_seconds : int
+        Offset of GPS time from UTC in seconds over the simulated period.
+
+    Returns
+    -------
+    numpy.ndarray
+        GPS time in seconds.
+    """
+
+    dtime = np.asarray(dtime, dtype='datetime64[us]')
+    delta = dtime - np.datetime64(GPS_EPOCH, 'us')
+
+    return delta.astype(np.float64)/1e6 + leap_seconds
+
+
+def satellite_positions(almanac, t):
+    """
+    Computes the ECEF position and clock offset of every satellite.
+
+    Parameters
+    ----------
+    almanac : dict
+        Almanac returned by load_yuma.
+    t : numpy.ndarray
+        GPS time of transmission in seconds since the GPS epoch, of any shape
+        that broadcasts against the number of satellites.
+
+    Returns
+    -------
+    tuple
+        Array of shape (..., 3) of satellite positions in metres, and array of
+        satellite clock offsets in seconds.
+    """
+
+    # Resolve the 1024 week rollover to the epoch nearest the first time
+    t_first = np.ravel(t)[0]
+    week = almanac['week'] + 1024*np.round(
+        (t_first/WEEK_SECONDS - almanac['week'])/1024)
+    tk = t - (week*WEEK_SECONDS + almanac['toa'])
+
+    a = almanac['sqrt_a']**2
+    e = almanac['e']
+    m = almanac['m0'] + np.sqrt(MU/a**3)*tk
+
+    # Kepler's equation by Newton iteration
+    ecc = m.copy()
+    for _ in range(8):
+        ecc = ecc - (ecc - e*np.sin(ecc) - m)/(1 - e*np.cos(ecc))
+
+    nu = np.arctan2(np.sqrt(1 - e**2)*np.sin(ecc), np.cos(ecc) - e)
+    phi = nu + almanac['w']
+    r = a*(1 - e*np.cos(ecc))
+    xp = r*np.cos(phi)
+    yp = r*np.sin(phi)
+
+    omega = (almanac['omega0'] + (almanac['omega_dot'] - OMEGA_E)*tk
+             - OMEGA_E*almanac['toa'])
+    cos_i = np.cos(almanac['i0'])
+
+    pos = np.stack([xp*np.cos(omega) - yp*cos_i*np.sin(omega),
+                    xp*np.sin(omega) + yp*cos_i*np.cos(omega),
+                    yp*np.sin(almanac['i0'])], axis=-1)
+
+    return pos, almanac['af0'] + almanac['af1']*tk
+
+
+def _enu_rotation(lat, lon):
+    """ Returns the (n, 3, 3) rotations from ECEF to local east, north, up """
+
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    sin_lat, cos_lat = np.sin(lat), np.cos(lat)
+    sin_lon, cos_lon = np.sin(lon), np.cos(lon)
+    zero = np.zeros_like(lat)
+
+    return np.stack([np.stack([-sin_lon, cos_lon, zero], axis=-1),
+                     np.stack([-sin_lat*cos_lon, -sin_lat*sin_lon, cos_lat],
+                              axis=-1),
+                     np.stack([cos_lat*cos_lon, cos_lat*sin_lon, sin_lat],
+                              axis=-1)], axis=-2)
+
+
+def _observe(almanac, t, lat, lon, height, mask, healthy):
+    """ Computes the geometry and ranges for a block of epochs """
+
+    rx = ecef(lat, lon, height)[:, None, :]
+
+    # Iterate the signal transit time, rotating the satellite position at
+    # transmission into the ECEF frame at reception (Sagnac effect)
+    tau = np.full((len(t), len(almanac['prn'])), 0.075)
+    for _ in range(2):
+        sat, sat_clock = satellite_positions(almanac, t[:, None] - tau)
+        theta = OMEGA_E*tau
+        sat = np.stack([sat[..., 0]*np.cos(theta) + sat[..., 1]*np.sin(theta),
+                        sat[..., 1]*np.cos(theta) - sat[..., 0]*np.sin(theta),
+                        sat[..., 2]], axis=-1)
+        los = sat - rx
+        ranges = np.linalg.norm(los, axis=-1)
+        tau = ranges/C
+
+    enu = np.einsum('tij,tsj->tsi', _enu_rotation(lat, lon),
+                    los/ranges[..., None])
+    elevation = np.degrees(np.arcsin(np.clip(enu[..., 2], -1., 1.)))
+    azimuth = np.degrees(np.arctan2(enu[..., 0], enu[..., 1])) % 360.
+    visible = (elevation >= mask) & healthy
+
+    # Dilution of precision from the visible satellites of each epoch
+    g = np.concatenate([-enu, np.ones(enu.shape[:-1] + (1,))], axis=-1)
+    g = g*visible[..., None]
+    normal = np.einsum('tsi,tsj->tij', g, g)
+    enough = visible.sum(axis=1) >= 4
+    normal[~enough] = np.eye(4)
+    q = np.linalg.inv(normal)
+    q[~enough] = np.nan
+
+    return {'sat_pos': sat, 'sat_clock': sat_clock, 'range': ranges,
+            'elevation': elevation, 'azimuth': azimuth, 'visible': visible,
+            'q': q}
+
+
+def observables(result, almanac, mask=10., height=0., clock_bias=0.,
+                clock_drift=0., noise=0., seed=None, gps_time=None,
+                leap_seconds=18, chunk_size=3600):
+    """
+    Computes the satellite geometry and receiver observables along a track.
+
+    Parameters
+    ----------
+    result : dict
+        Dictionary of results returned by Simulation.run_sim.
+    almanac : dict / str
+        Almanac returned by load_yuma, or the path to a YUMA almanac file.
+    mask : float
+        Elevation mask in degrees.
+    height : float / array_like
+        Receiver height above the WGS84 ellipsoid in metres.
+    clock_bias : float
+        Receiver clock bias in seconds at the first fix.
+    clock_drift : float
+        Receiver clock drift in seconds per second.
+    noise : float
+        Standard deviation in metres of white noise added to the
+        pseudoranges.
+    seed : int
+        Seed of the pseudorange noise.
+    gps_time : array_like
+        GPS time of each fix in seconds since the GPS epoch. Defaults to the
+        result dtime, which must then be datetime.datetime in UTC.
+    leap_seconds : int
+        Offset of GPS time from UTC in seconds over the simulated period.
+    chunk_size : int
+        Number of fixes processed at once, which bounds the memory used.
+
+    Returns
+    -------
+    dict
+        Dictionary of the observables, with arrays of shape (fixes,
+        satellites) unless noted:
+        - prn: PRN number of each satellite, shape (satellites,)
+        - gps_time: GPS time of each fix, shape (fixes,)
+        - sat_pos: ECEF satellite positions at transmission, shape (fixes,
+          satellites, 3)
+        - elevation: Elevation in degrees
+        - azimuth: Azimuth in degrees
+        - visible: True for healthy satellites above the elevation mask
+        - pseudorange: Pseudorange in metres, NaN if not visible
+        - gdop, pdop, hdop, vdop, tdop: Dilution of precision, NaN with fewer
+          than four visible satellites, shape (fixes,)
+    """
+
+    if isinstance(almanac, str):
+        almanac = load_yuma(almanac)
+
+    if gps_time is None:
+        gps_time = gps_seconds(result['dtime'], leap_seconds)
+    gps_time = np.asarray(gps_time, dtype=float)
+
+    lat = np.asarray(result['lat'], dtype=float)
+    lon = np.asarray(result['lon'], dtype=float)
+    height = np.broadcast_to(np.asarray(height, dtype=float), lat.shape)
+    healthy = almanac['health'] == 0
+
+    blocks = [_observe(almanac, gps_time[i:i+chunk_size],
+                       lat[i:i+chunk_size], lon[i:i+chunk_size],
+                       height[i:i+chunk_size], mask, healthy)
+              for i in range(0, len(lat), chunk_size)]
+    obs = {key: np.concatenate([block[key] for block in blocks])
+           for key in blocks[0]}
+
+    rx_clock = clock_bias + clock_drift*(gps_time - gps_time[0])
+    pseudorange = obs['range'] + C*(rx_clock[:, None] - obs['sat_clock'])
+    if noise:
+        pseudorange += np.random.default_rng(seed).normal(
+            0., noise, pseudorange.shape)
+    pseudorange[~obs['visible']] = np.nan
+
+    q = obs['q']
+    q_diag = np.diagonal(q, axis1=1, axis2=2)
+
+    return {'prn': almanac['prn'],
+            'gps_time': gps_time,
+            'sat_pos': obs['sat_pos'],
+            'elevation': obs['elevation'],
+            'azimuth': obs['azimuth'],
+            'visible': obs['visible'],
+            'pseudorange': pseudorange,
+            'gdop': np.sqrt(q_diag.sum(axis=1)),
+            'pdop': np.sqrt(q_diag[:, :3].sum(axis=1)),
+            'hdop': np.sqrt(q_diag[:, :2].sum(axis=1)),
+            'vdop': np.sqrt(q_diag[:, 2]),
+            'tdop': np.sqrt(q_diag[:, 3])}
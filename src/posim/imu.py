@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+""" Synthetic accelerometer and gyroscope readings from trajectories """
+
+import numpy as np
+
+from .geometry import azimuth, enu
+
+GRAVITY = 9.80665
+
+
+def _hermite(s, p, tt):
+    """
+    Evaluates the cubic Hermite interpolant of p(s) and its first and second
+    derivatives at tt, with knot slopes from central differences.
+    """
+
+    m = np.gradient(p, s)
+    i = np.clip(np.searchsorted(s, tt, side='right') - 1, 0, len(s) - 2)
+    h = s[i+1] - s[i]
+    u = (tt - s[i])/h
+
+    p0, p1 = p[i], p[i+1]
+    m0, m1 = m[i]*h, m[i+1]*h
+
+    value = ((2*u**3 - 3*u**2 + 1)*p0 + (u**3 - 2*u**2 + u)*m0
+             + (-2*u**3 + 3*u**2)*p1 + (u**3 - u**2)*m1)
+    rate = ((6*u**2 - 6*u)*p0 + (3*u**2 - 4*u + 1)*m0
+            + (-6*u**2 + 6*u)*p1 + (3*u**2 - 2*u)*m1)/h
+    accel = ((12*u - 6)*p0 + (6*u - 4)*m0
+             + (-12*u + 6)*p1 + (6*u - 2)*m1)/h**2
+
+    return value, rate, accel
+
+
+class _SensorModel:
+    """ Constant bias, random walk bias and white noise of a 3-axis sensor,
+    carried across chunks. """
+
+    def __init__(self, bias, bias_walk, noise, generator):
+        self.bias = np.broadcast_to(np.asarray(bias, dtype=float), (3,))
+        self.bias_walk = bias_walk
+        self.noise = noise
+        self.generator = generator
+        self.walk = np.zeros(3)
+
+    def apply(self, values, dt):
+        values = values + self.bias
+        if self.bias_walk:
+            steps = self.generator.normal(0., self.bias_walk*np.sqrt(dt),
+                                          values.shape)
+            walk = self.walk + np.cumsum(steps, axis=0)
+            self.walk = walk[-1]
+            values = values + walk
+        if self.noise:
+            values = values + self.generator.normal(0., self.noise,
+                                                    values.shape)
+        return values
+
+
+def iter_imu(result, rate=100., chunk_size=1000000, accel_bias=0.,
+             gyro_bias=0., accel_bias_walk=0., gyro_bias_walk=0.,
+             accel_noise=0., gyro_noise=0., seed=None, gravity=GRAVITY):
+    """
+    Derives accelerometer and gyroscope readings from a simulated track in
+    chunks, so long high rate runs do not need to fit in memory.
+
+    The east and north position and the heading from the x and y direction
+    vectors are interpolated with cubic Hermite splines, whose derivatives
+    give the acceleration and turn rate at every sample. Readings are in the
+    forward, right, down body frame of a level sensor pointing along the
+    heading, so the accelerometer reads -gravity on the down axis at rest.
+
+    Parameters
+    ----------
+    result : dict
+        Dictionary of results returned by Simulation.run_sim.
+    rate : float
+        Output sample rate in Hz.
+    chunk_size : int
+        Number of output samples in each chunk.
+    accel_bias : float / array_like
+        Constant accelerometer bias in m/s^2, for all or each axis.
+    gyro_bias : float / array_like
+        Constant gyroscope bias in rad/s, for all or each axis.
+    accel_bias_walk : float
+        Accelerometer bias random walk in m/s^2 per square root second.
+    gyro_bias_walk : float
+        Gyroscope bias random walk in rad/s per square root second.
+    accel_noise : float
+        Standard deviation of accelerometer white noise in m/s^2.
+    gyro_noise : float
+        Standard deviation of gyroscope white noise in rad/s.
+    seed : int
+        Seed of the bias random walks and white noise.
+    gravity : float
+        Magnitude of gravity in m/s^2.
+
+    Yields
+    ------
+    dict
+        Dictionary of each chunk of readings:
+        - name: Name of the character
+        - stime: Time of each sample since the start of the simulation
+        - accel: Array of shape (samples, 3) of specific force in m/s^2
+        - gyro: Array of shape (samples, 3) of angular rate in rad/s
+    """
+
+    s = np.asarray(result['stime'], dtype=float)
+    lat = np.asarray(result['lat'], dtype=float)
+    lon = np.asarray(result['lon'], dtype=float)
+
+    if len(s) < 2:
+        raise ValueError("At least two fixes are needed to derive IMU data.")
+
+    east, north = enu(lat, lon, lat[0], lon[0])
+    heading = np.unwrap(np.radians(azimuth(result['x'], result['y'])))
+
+    generator = np.random.default_rng(seed)
+    accel_model = _SensorModel(accel_bias, accel_bias_walk, accel_noise,
+                               generator)
+    gyro_model = _SensorModel(gyro_bias, gyro_bias_walk, gyro_noise,
+                              generator)
+
+    dt = 1./rate
+    n_samples = int(np.floor((s[-1] - s[0])*rate)) + 1
+
+    for start in range(0, n_samples, chunk_size):
+        tt = s[0] + np.arange(start, min(start + chunk_size, n_samples))*dt
+
+        _, _, accel_e = _hermite(s, east, tt)
+        _, _, accel_n = _hermite(s, north, tt)
+        psi, psi_rate, _ = _hermite(s, heading, tt)
+
+        sin_psi = np.sin(psi)
+        cos_psi = np.cos(psi)
+
+        accel = np.column_stack([accel_e*sin_psi + accel_n*cos_psi,
+                                 accel_e*cos_psi - accel_n*sin_psi,
+                                 np.full(len(tt), -gravity)])
+        gyro = np.column_stack([np.zeros(len(tt)), np.zeros(len(tt)),
+                                psi_rate])
+
+        yield {'name': result['name'],
+               'stime': tt,
+               'accel': accel_model.apply(accel, dt),
+               'gyro': gyro_model.apply(gyro, dt)}
+
+
+def derive_imu(result, rate=100., **kwargs):
+    """
+    Derives accelerometer and gyroscope readings from a simulated track.
+
+    Parameters
+    ----------
+    result : dict
+        Dictionary of results returned by Simulation.run_sim.
+    rate : float
+        Output sample rate in Hz.
+    **kwargs
+        Bias, noise and seed options passed on to iter_imu.
+
+    Returns
+    -------
+    dict
+        Dictionary of the readings, in the format yielded by iter_imu.
+    """
+
+    chunks = list(iter_imu(result, rate, **kwargs))
+
+    return {'name': result['name'],
+            'stime': np.concatenate([chunk['stime'] for chunk in chunks]),
+            'accel': np.concatenate([chunk['accel'] for chunk in chunks]),
+            'gyro': np.concatenate([chunk['gyro'] for chunk in chunks])}
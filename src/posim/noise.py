@@ -6,14 +6,14 @@ def no_noise(o, _):
 
 def random(o, params):
     """ Random noise """
-    import random
+    from .rng import get_random
     if params == None:
         b_min = 0.5
         b_max = 1.5
     else:
         b_min = params['min']
         b_max = params['max']
-    o_noise = o*random.uniform(b_min, b_max)
+    o_noise = o*get_random().uniform(b_min, b_max)
     return o_noise
 
 def drift(o, params):
@@ -14,7 +14,7 @@ def power(d, params):
 
 def random(d, params):
     """ Random path """
-    import random
+    from .rng import get_random
     import math
     if params == None:
         b_min = 0.
@@ -22,7 +22,7 @@ def random(d, params):
     else:
         b_min = params['min']
         b_max = params['max']
-    d_noise = random.uniform(b_min, b_max)
+    d_noise = get_random().uniform(b_min, b_max)
     return d_noise
 
 
@@ -79,6 +79,43 @@ def meandering_lon(d, params):
     return meandering(d, params)
 
 
+# ROUTE PATH
+def route(d, params):
+    """ Follows the segments of a route built by convert.coords2route or
+    convert.load_route. Moves linearly along each segment.
+    
+    Past the end of the route the direction of the last segment is kept, so
+    a character overshoots in a straight line unless its velocity function
+    stops it (see velocities.profile)."""
+    import numpy as np
+    
+    rte = params['route']
+    
+    if len(rte['azi']) == 0:
+        return 0
+    
+    # Index of the segment that ends at or beyond the distance travelled. A
+    # step ending on a vertex (to within rounding) keeps the segment it
+    # travelled along.
+    i = np.searchsorted(rte['dist'], d - 1e-6, side='right') - 1
+    i = min(max(i, 0), len(rte['azi']) - 1)
+    
+    linear_params = {'aziDeg': rte['azi'][i]}
+    
+    if params['ordinate'] == 'lat':
+        func = linear_lat
+    elif params['ordinate'] == 'lon':
+        func = linear_lon
+    
+    return func(d, linear_params)
+
+def route_lat(d, params):
+    return route(d, {'ordinate': 'lat', 'route': params['route']})
+
+def route_lon(d, params):
+    return route(d, {'ordinate': 'lon', 'route': params['route']})
+
+
 # TRIGONOMETRIC PATHS
 def sine(d, _):
     import math
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+""" Simulation results with lazily derived columns """
+
+import numpy as np
+
+from .geometry import azimuth, enu, segments
+
+
+class Result(dict):
+    """
+    Dictionary of the columns returned by Simulation.run_sim, held as numpy
+    arrays, that also derives the following columns on first access and
+    keeps them:
+    - step: Distance in metres travelled since the previous fix
+    - speed: step divided by the time since the previous fix
+    - heading: Azimuth in degrees of the x and y direction vector
+    - east: East offset in metres from the start position
+    - north: North offset in metres from the start position
+
+    Derived columns are reported by get and in before they are computed, but
+    keys, values and items only list the columns computed so far.
+
+    Attributes
+    ----------
+    origin : tuple
+        Latitude and longitude of the start position, from which the east
+        and north offsets are measured.
+    prev_pos : tuple
+        Latitude and longitude of the position before the first fix.
+    timestep : float
+        Time increment before the first fix.
+
+    Methods
+    -------
+
+    __init__(data, origin, prev_pos, timestep):
+        Constructs all the attributes for the Result object.
+
+    get(key, default):
+        Returns a stored or derived column, or default if neither.
+
+    between(start, end):
+        Returns the fixes from start up to but excluding end without copying.
+    """
+
+    DERIVED = ('step', 'speed', 'heading', 'east', 'north')
+
+    def __init__(self, data, origin, prev_pos=None, timestep=1):
+        """
+        Constructs all the attributes for the Result object.
+
+        Parameters
+        ----------
+        data : dict
+            Dictionary of results in the format returned by run_sim.
+        origin : tuple
+            Latitude and longitude of the start position, from which the east
+            and north offsets are measured.
+        prev_pos : tuple
+            Latitude and longitude of the position before the first fix.
+            Defaults to origin.
+        timestep : float
+            Time increment before the first fix.
+        """
+
+        super().__init__()
+        for key, value in data.items():
+            if isinstance(value, (list, tuple)):
+                value = np.asarray(value, dtype=object if key == 'dtime'
+                                   else float)
+            dict.__setitem__(self, key, value)
+
+        self.origin = tuple(origin)
+        self.prev_pos = tuple(origin if prev_pos is None else prev_pos)
+        self.timestep = timestep
+
+    def __contains__(self, key):
+        """ True for stored columns and for the derived columns """
+        return dict.__contains__(self, key) or key in self.DERIVED
+
+    def get(self, key, default=None):
+        """ Returns a stored or derived column, or default if neither """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __missing__(self, key):
+        """ Computes and keeps a derived column on first access """
+
+        if key not in self.DERIVED:
+            raise KeyError(key)
+
+        if key == 'step':
+            lat = np.concatenate(([self.prev_pos[0]], self['lat']))
+            lon = np.concatenate(([self.prev_pos[1]], self['lon']))
+            value = segments(lat, lon)[0]
+        elif key == 'speed':
+            if len(self['stime']) == 0:
+                value = np.empty(0)
+            else:
+                dt = np.diff(self['stime'], prepend=self['stime'][0]
+                             - self.timestep)
+                value = self['step']/dt
+        elif key == 'heading':
+            value = azimuth(self['x'], self['y'])
+        else:
+            east, north = enu(self['lat'], self['lon'], *self.origin)
+            dict.__setitem__(self, 'east', east)
+            dict.__setitem__(self, 'north', north)
+            return self[key]
+
+        dict.__setitem__(self, key, value)
+        return value
+
+    def between(self, start=None, end=None):
+        """
+        Returns the fixes from start up to but excluding end. Columns are
+        views of this Result's arrays, including derived columns already
+        computed.
+
+        Parameters
+        ----------
+        start : datetime.datetime / float / int
+            Start of the range, compared with dtime if a datetime and with
+            stime otherwise. From the first fix if None.
+        end : datetime.datetime / float / int
+            End of the range, compared as start. Up to the last fix if None.
+
+        Returns
+        -------
+        Result
+            Result of the fixes in the range.
+        """
+
+        def index(t, default):
+            if t is None:
+                return default
+            if isinstance(t, (int, float, np.number)):
+                return int(np.searchsorted(self['stime'], t, side='left'))
+            return int(np.searchsorted(self['dtime'], t, side='left'))
+
+        i0 = index(start, 0)
+        i1 = index(end, len(self['stime']))
+
+        sliced = {key: value[i0:i1] if isinstance(value, np.ndarray)
+                  else value for key, value in self.items()}
+
+        if i0 > 0:
+            prev_pos = (self['lat'][i0-1], self['lon'][i0-1])
+            timestep = self['stime'][i0] - self['stime'][i0-1] \
+                if i0 < len(self['stime']) else self.timestep
+        else:
+            prev_pos = self.prev_pos
+            timestep = self.timestep
+
+        return Result(sliced, self.origin, prev_pos, timestep)
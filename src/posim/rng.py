@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+""" Seedable random number generators for the random path, noise and
+velocity functions """
+
+import random
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+_local = threading.local()
+
+
+def get_random():
+    """
+    Returns the random generator seeded for the current thread, or the global
+    random module if the running simulation is not seeded.
+    """
+    return getattr(_local, 'generator', None) or random
+
+
+@contextmanager
+def seeded(seed):
+    """
+    Seeds get_random for the current thread while the context is active.
+    
+    Parameters
+    ----------
+    seed : int
+        Seed of the generator.
+    """
+    
+    previous = getattr(_local, 'generator', None)
+    _local.generator = random.Random(seed)
+    try:
+        yield _local.generator
+    finally:
+        _local.generator = previous
+
+
+def derive_seed(seed, index):
+    """
+    Derives an independent seed for a character from a simulation seed.
+    
+    Parameters
+    ----------
+    seed : int
+        Seed of the simulation.
+    index : int
+        Index of the character in the full character list.
+    
+    Returns
+    -------
+    int
+        Seed of the character.
+    """
+    
+    state = np.random.SeedSequence([seed, index]).generate_state(1, np.uint64)
+    return int(state[0])
@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+""" Movement constrained to a road network with cached shortest paths """
+
+import heapq
+import json
+from collections import OrderedDict
+
+import numpy as np
+
+from . import paths, velocities
+from .convert import coords2route
+from .geometry import segments
+from .rng import get_random
+from .simulate import Character
+
+
+class _SearchTree:
+    """ Dijkstra search from a single origin that can be resumed until any
+    destination is settled. """
+    
+    def __init__(self, origin):
+        self.dist = {origin: 0.}
+        self.prev = {origin: None}
+        self.settled = set()
+        self.heap = [(0., origin)]
+    
+    def search(self, network, dest):
+        """ Expands the tree until dest is settled or every node is. """
+        
+        adj = network._adj
+        dist = self.dist
+        prev = self.prev
+        settled = self.settled
+        heap = self.heap
+        
+        while dest not in settled and heap:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            
+            for v, length in adj.get(u, {}).items():
+                nd = d + length
+                if v not in dist or nd < dist[v]:
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd, v))
+        
+        return dest in self.settled
+
+
+class RoadNetwork:
+    """
+    Attributes
+    ----------
+    nodes : dict
+        Dictionary of the latitude and longitude of each node id.
+    cache_size : int
+        Number of origins whose shortest path trees are kept, and of routes
+        between origin and destination pairs.
+    
+    Methods
+    -------
+    
+    __init__():
+        Constructs all the attributes for the RoadNetwork object.
+    
+    add_node(node, lat, lon):
+        Adds a node to the network.
+    
+    add_edge(u, v, geometry, oneway):
+        Adds a road between two nodes.
+    
+    shortest_path(orig, dest):
+        Returns the node ids of the shortest path between two nodes.
+    
+    route(orig, dest):
+        Returns the compact route of the shortest path between two nodes.
+    
+    random_pair():
+        Returns a random origin and destination joined by a path.
+    
+    character(orig, dest, velocity, name):
+        Returns a Character that drives between two nodes.
+    """
+    
+    def __init__(self):
+        """
+        Constructs all the attributes for the RoadNetwork object.
+        
+        Parameters
+        ----------
+        nodes : dict
+            Dictionary of the latitude and longitude of each node id.
+        cache_size : int
+            Number of origins whose shortest path trees are kept, and of
+            routes between origin and destination pairs.
+        """
+        
+        self.nodes = {}
+        self.cache_size = 1024
+        
+        self._adj = {}
+        self._edges = {}
+        self._trees = OrderedDict()
+        self._routes = OrderedDict()
+    
+    def add_node(self, node, lat, lon):
+        """
+        Adds a node to the network.
+        
+        Parameters
+        ----------
+        node : hashable
+            Id of the node.
+        lat : float
+            Latitude of the node.
+        lon : float
+            Longitude of the node.
+        """
+        
+        self.nodes[node] = (float(lat), float(lon))
+    
+    def add_edge(self, u, v, geometry=None, oneway=False):
+        """
+        Adds a road between two nodes. Of several roads joining the same
+        nodes, only the shortest is kept.
+        
+        Parameters
+        ----------
+        u : hashable
+            Id of the start node.
+        v : hashable
+            Id of the end node.
+        geometry : list
+            List of (latitude, longitude) tuples from u to v. Defaults to the
+            straight line between the nodes.
+        oneway : bool
+            If True, the road can only be travelled from u to v.
+        """
+        
+        if geometry is None:
+            geometry = [self.nodes[u], self.nodes[v]]
+        geometry = np.asarray(geometry, dtype=float).reshape(-1, 2)
+        length = segments(geometry[:, 0], geometry[:, 1])[0].sum()
+        
+        self._add_directed(u, v, length, geometry)
+        if not oneway:
+            self._add_directed(v, u, length, geometry[::-1])
+        
+        # Cached searches may no longer be shortest
+        self._trees.clear()
+        self._routes.clear()
+    
+    def _add_directed(self, u, v, length, geometry):
+        """ Adds a directed edge, keeping the shorter of parallel edges """
+        
+        if (u, v) in self._edges and self._edges[(u, v)][0] <= length:
+            return
+        self._adj.setdefault(u, {})[v] = length
+        self._edges[(u, v)] = (length, geometry)
+    
+    def _cached(self, cache, key, default):
+        """ Returns an item of an LRU cache, adding default() if missing """
+        
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        
+        value = default()
+        cache[key] = value
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return value
+    
+    def shortest_path(self, orig, dest):
+        """
+        Returns the node ids of the shortest path between two nodes.
+        
+        Parameters
+        ----------
+        orig : hashable
+            Id of the origin node.
+        dest : hashable
+            Id of the destination node.
+        
+        Returns
+        -------
+        list
+            Node ids from orig to dest, or None if dest cannot be reached.
+        """
+        
+        tree = self._cached(self._trees, orig, lambda: _SearchTree(orig))
+        if not tree.search(self, dest):
+            return None
+        
+        path = [dest]
+        while tree.prev[path[-1]] is not None:
+            path.append(tree.prev[path[-1]])
+        
+        return path[::-1]
+    
+    def _build_route(self, orig, dest):
+        """ Joins the edge geometries along the shortest path """
+        
+        path = self.shortest_path(orig, dest)
+        if path is None:
+            return None
+        if len(path) == 1:
+            return coords2route([self.nodes[orig]])
+        
+        # Drop the first point of every edge after the first, which repeats
+        # the last point of the previous edge
+        geometries = [self._edges[(u, v)][1] for u, v in zip(path, path[1:])]
+        coords = np.concatenate([geometries[0]]
+                                + [geometry[1:] for geometry in geometries[1:]])
+        
+        return coords2route(coords)
+    
+    def route(self, orig, dest):
+        """
+        Returns the compact route of the shortest path between two nodes,
+        for use with paths.route_lat and paths.route_lon.
+        
+        Parameters
+        ----------
+        orig : hashable
+            Id of the origin node.
+        dest : hashable
+            Id of the destination node.
+        
+        Returns
+        -------
+        dict
+            Dictionary of the route, as returned by convert.coords2route, or
+            None if dest cannot be reached.
+        """
+        
+        return self._cached(self._routes, (orig, dest),
+                            lambda: self._build_route(orig, dest))
+    
+    def random_pair(self, max_tries=100):
+        """
+        Returns a random origin and destination joined by a path, drawn with
+        rng.get_random so seeded simulations pick the same pairs.
+        
+        Parameters
+        ----------
+        max_tries : int
+            Number of pairs to draw before giving up.
+        
+        Returns
+        -------
+        tuple
+            Ids of the origin and destination nodes.
+        """
+        
+        node_ids = list(self._adj)
+        generator = get_random()
+        
+        for _ in range(max_tries):
+            orig = generator.choice(node_ids)
+            dest = generator.choice(node_ids)
+            if orig != dest and self.route(orig, dest) is not None:
+                return orig, dest
+        
+        raise ValueError("Could not find a connected origin and destination.")
+    
+    def character(self, sim, orig=None, dest=None, velocity=13.9,
+                  name='Character'):
+        """
+        Returns a Character that drives along the shortest path between two
+        nodes at a fixed velocity and stops at the destination.
+        
+        The route is resampled at the distance travelled in each time
+        increment, and each increment moves exactly from one sample to the
+        next. Steps therefore never cut across bends in the road, and the
+        last fix lands on the destination.
+        
+        Parameters
+        ----------
+        sim : Simulation
+            Simulation the character will be run in. The route is resampled
+            at its timestep, and run_sim rejects the character if the
+            timestep is later changed.
+        orig : hashable
+            Id of the origin node. Random if either orig or dest is None.
+        dest : hashable
+            Id of the destination node. Random if either orig or dest is None.
+        velocity : float
+            Travel velocity in metres per second.
+        name : str
+            Name of the character.
+        
+        Returns
+        -------
+        Character
+            Character following the route.
+        """
+        
+        if orig is None or dest is None:
+            orig, dest = self.random_pair()
+        
+        rte = self.route(orig, dest)
+        if rte is None:
+            raise ValueError("dest cannot be reached from orig.")
+        
+        # Positions along the route at the end of each time increment
+        timestep = sim.timestep
+        length = rte['dist'][-1]
+        targets = np.arange(0., length, velocity*timestep)
+        targets = np.append(targets, length)
+        samples = coords2route(np.column_stack(
+            [np.interp(targets, rte['dist'], rte['lat']),
+             np.interp(targets, rte['dist'], rte['lon'])]))
+        
+        char = Character()
+        char.name = name
+        char.start_pos = (rte['lat'][0], rte['lon'][0])
+        char.lat_func = paths.route_lat
+        char.lon_func = paths.route_lon
+        char.lat_func_params = {'route': samples}
+        char.lon_func_params = {'route': samples}
+        char.velocity_func = velocities.profile
+        char.velocity_func_params = {
+            'velocities': np.diff(samples['dist'])/timestep,
+            'timestep': timestep}
+        
+        return char
+
+
+def load_network(path):
+    """
+    Loads a road network from a JSON file.
+    
+    Two layouts are read:
+    - A dictionary with a nodes list of {"id", "lat", "lon"} objects and an
+      edges list of {"from", "to"} objects, each with an optional geometry
+      list of [lat, lon] points and an optional oneway flag.
+    - A GeoJSON FeatureCollection of LineString roads. Nodes are the road
+      end points, joined where they share coordinates, and the oneway
+      property is read if present.
+    
+    Parameters
+    ----------
+    path : str
+        Path to the JSON file.
+    
+    Returns
+    -------
+    RoadNetwork
+        The loaded road network.
+    """
+    
+    with open(path) as f:
+        data = json.load(f)
+    
+    network = RoadNetwork()
+    
+    if data.get('type') == 'FeatureCollection':
+        for feature in data['features']:
+            if feature['geometry']['type'] != 'LineString':
+                continue
+            # GeoJSON positions are [lon, lat]
+            geometry = [(lat, lon) for lon, lat, *_ in
+                        feature['geometry']['coordinates']]
+            u = geometry[0]
+            v = geometry[-1]
+            network.add_node(u, *u)
+            network.add_node(v, *v)
+            properties = feature.get('properties') or {}
+            network.add_edge(u, v, geometry,
+                             oneway=bool(properties.get('oneway', False)))
+    else:
+        for node in data['nodes']:
+            network.add_node(node['id'], node['lat'], node['lon'])
+        for edge in data['edges']:
+            network.add_edge(edge['from'], edge['to'], edge.get('geometry'),
+                             oneway=bool(edge.get('oneway', False)))
+    
+    return network
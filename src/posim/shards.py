@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+""" Partitioning of character lists across hosts and merging of the shard
+outputs """
+
+import pickle
+
+import numpy as np
+
+
+def partition(n_chars, shard_index, shard_count):
+    """
+    Returns the indices of the characters simulated by a shard.
+    
+    Characters are dealt round-robin, so every shard gets a similar share of
+    the list and the assignment only depends on the list order.
+    
+    Parameters
+    ----------
+    n_chars : int
+        Number of characters in the full character list.
+    shard_index : int
+        Index of the shard, from 0 to shard_count - 1.
+    shard_count : int
+        Total number of shards.
+    
+    Returns
+    -------
+    range
+        Indices of the characters in the full list.
+    """
+    
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError("shard_index must be between 0 and shard_count - 1.")
+    
+    return range(shard_index, n_chars, shard_count)
+
+
+def save(path, results):
+    """
+    Writes the results of a shard to a file for merging.
+    
+    Parameters
+    ----------
+    path : str
+        Path of the shard file.
+    results : list
+        List of dictionaries returned by Simulation.run_shard.
+    """
+    
+    with open(path, 'wb') as f:
+        pickle.dump(results, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load(path):
+    """
+    Reads the results of a shard written by save.
+    
+    Parameters
+    ----------
+    path : str
+        Path of the shard file.
+    
+    Returns
+    -------
+    list
+        List of dictionaries returned by Simulation.run_shard.
+    """
+    
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def merge(shards, time_ordered=False):
+    """
+    Combines the outputs of every shard into a single result set.
+    
+    Parameters
+    ----------
+    shards : list
+        List of shard outputs, each either the list returned by
+        Simulation.run_shard or the path of a file written by save.
+    time_ordered : bool
+        If False, returns the results in the order of the full character
+        list, as Simulation.run_threaded would. If True, returns every fix
+        of every character in a single dictionary of arrays, ordered by time
+        and then by character index.
+    
+    Returns
+    -------
+    list / dict
+        List of dictionaries of results, or if time_ordered is True a
+        dictionary of arrays with the keys name, index, dtime, stime, lat,
+        lon, y and x.
+    """
+    
+    results = []
+    for shard in shards:
+        if isinstance(shard, str):
+            shard = load(shard)
+        results.extend(shard)
+    
+    results.sort(key=lambda result: result['index'])
+    
+    if not time_ordered:
+        return results
+    
+    lengths = [len(result['stime']) for result in results]
+    fixes = {'name': np.repeat([result['name'] for result in results],
+                               lengths),
+             'index': np.repeat([result['index'] for result in results],
+                                lengths)}
+    
+    for key in ['dtime', 'stime', 'lat', 'lon', 'y', 'x']:
+        if results:
+            fixes[key] = np.concatenate([np.asarray(result[key])
+                                         for result in results])
+        else:
+            fixes[key] = np.empty(0)
+    
+    order = np.lexsort((fixes['index'], fixes['stime']))
+    
+    return {key: value[order] for key, value in fixes.items()}
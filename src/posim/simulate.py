@@ -7,6 +7,10 @@ from datetime import datetime
 from datetime import timedelta
 from geographiclib.geodesic import Geodesic
 
+from . import rng
+from . import shards
+from .result import Result
+
 
 class Simulation:
     """
@@ -20,6 +24,15 @@ class Simulation:
         End time of the simulated data.
     timestep : float
         Time increment in seconds of the readings.
+    seed : int
+        Seed from which the seed of each Character in a list is derived, by
+        its index in the list. Characters with their own seed keep it.
+    shard_index : int
+        Index of the shard simulated by run_shard.
+    shard_count : int
+        Number of shards the character list is partitioned into.
+    as_result : bool
+        If True, run_sim returns a Result instead of a dict.
         
     Methods
     -------
@@ -27,11 +40,17 @@ class Simulation:
     __init__():
         Constructs all the attributes for the Simulation object.
     
-    run_sim(char):
+    run_sim(char, seed):
         Runs a simulation instance.
     
     run_threaded(chars):
         Runs simulation instances in seperate threads for multiple Characters.
+    
+    run_shard(chars):
+        Runs the shard_index-th shard of a character list in seperate threads.
+    
+    run_multirate(char, timesteps, method, seed):
+        Runs a single simulation instance and outputs it at several timesteps.
     """
     
     def __init__(self):
@@ -48,6 +67,15 @@ class Simulation:
             End time of the simulated data.
         timestep : float
             Time increment in seconds of the readings.
+        seed : int
+            Seed from which the seed of each Character in a list is derived,
+            by its index in the list. Characters with their own seed keep it.
+        shard_index : int
+            Index of the shard simulated by run_shard.
+        shard_count : int
+            Number of shards the character list is partitioned into.
+        as_result : bool
+            If True, run_sim returns a Result instead of a dict.
         """
         
         self.geo = Geodesic.WGS84
@@ -56,8 +84,12 @@ class Simulation:
         self.end_time = datetime.strptime('01/01/2000 00:01:00',
                                               '%d/%m/%Y %H:%M:%S')
         self.timestep = 1
+        self.seed = None
+        self.shard_index = 0
+        self.shard_count = 1
+        self.as_result = False
 
-    def run_sim(self, char):
+    def run_sim(self, char, seed=None):
         """
         Runs a simulation instance.
         
@@ -65,10 +97,13 @@ class Simulation:
         ----------
         char : Character
             Instance of the Character class.
+        seed : int
+            Seed of the random path, noise and velocity functions. Defaults
+            to char.seed. Unseeded runs use the global random module.
         
         Returns
         -------
-        dict
+        dict / Result
             Dictionary of the simulation data:
             - name: Name of the character
             - dtime: Datetime / numeric time at each time increment
@@ -77,8 +112,34 @@ class Simulation:
             - lon: Longitude at each increment based on the geo ellipsoid
             - y: Y component of the direction vector
             - x: X component of the direction vector
+            If as_result is True, the same columns as arrays in a Result,
+            which also derives step, speed, heading, east and north.
         """
         
+        if seed is None:
+            seed = char.seed
+        
+        # Velocity profiles are indexed by the timestep they were built for
+        params = char.velocity_func_params
+        if (isinstance(params, dict) and 'timestep' in params
+                and abs(params['timestep'] - self.timestep) > 1e-9):
+            raise ValueError("Character velocity was built for a different "
+                             "timestep.")
+        
+        if seed is None:
+            result = self._simulate(char)
+        else:
+            with rng.seeded(seed):
+                result = self._simulate(char)
+        
+        if self.as_result:
+            result = Result(result, char.start_pos, timestep=self.timestep)
+        
+        return result
+    
+    def _simulate(self, char):
+        """ Runs a simulation instance with the current random generator. """
+        
         # Type check start_time and end_time
         if all(isinstance(input_time, datetime) for input_time in
                [self.start_time, self.end_time]):
@@ -194,8 +255,140 @@ class Simulation:
             List of dictionaries containing the results of each simulation.
         """
             
+        return self._run_indexed(chars, range(len(chars)))
+    
+    def run_shard(self, chars=[]):
+        """
+        Runs the shard_index-th of shard_count shards of a character list in
+        seperate threads.
+        
+        Each host or process is given the full character list and its own
+        shard_index. Seeds are derived from the index of each Character in
+        the full list, so the merged output of every shard does not depend
+        on shard_count.
+        
+        Parameters
+        ----------
+        chars : list
+            Full list of Character instances.
+        
+        Returns
+        -------
+        list
+            List of dictionaries containing the results of each simulation in
+            the shard, with an additional index key giving the position of
+            the Character in chars. See shards.merge to combine the shards.
+        """
+        
+        indices = shards.partition(len(chars), self.shard_index,
+                                   self.shard_count)
+        results = self._run_indexed(chars, indices)
+        
+        for idx, result in zip(indices, results):
+            result['index'] = idx
+        
+        return results
+    
+    def run_multirate(self, char, timesteps, method='decimate', seed=None):
+        """
+        Runs a single simulation instance at the internal timestep and outputs
+        it at several coarser timesteps, so every output shares the same path.
+        
+        Parameters
+        ----------
+        char : Character
+            Instance of the Character class.
+        timesteps : list
+            Output time increments, each a whole multiple of timestep.
+        method : str / dict
+            How each coarser output is derived from the internal increments:
+            - decimate: Keep every n-th increment
+            - mean: Average the lat, lon, y and x over a window one output
+              timestep wide centred on each output increment, so the mean
+              and decimated outputs share the same stime. For an even number
+              of increments per output the two end increments get half
+              weight. Windows are truncated at the start and end of the run.
+            A dictionary maps each output timestep to its own method.
+        seed : int
+            Seed of the random path, noise and velocity functions. Defaults
+            to char.seed.
+        
+        Returns
+        -------
+        dict
+            Dictionary of the results at each output timestep, in the format
+            returned by run_sim.
+        """
+        
+        for timestep in timesteps:
+            ratio = timestep/self.timestep
+            if ratio < 1 or abs(ratio - round(ratio)) > 1e-9:
+                raise ValueError("Output timesteps must be whole multiples of "
+                                 "timestep.")
+        
+        result = self.run_sim(char, seed)
+        n_increments = len(result['stime'])
+        
+        arrays = {key: np.asarray(result[key], dtype=float)
+                  for key in ['lat', 'lon', 'y', 'x']}
+        
+        outputs = {}
+        for timestep in timesteps:
+            step = int(round(timestep/self.timestep))
+            starts = np.arange(0, n_increments, step)
+            
+            if isinstance(method, dict):
+                timestep_method = method[timestep]
+            else:
+                timestep_method = method
+            
+            output = {'name': result['name'],
+                      'dtime': result['dtime'][::step],
+                      'stime': result['stime'][::step]}
+            
+            if timestep_method == 'decimate':
+                for key, values in arrays.items():
+                    output[key] = values[starts].tolist()
+                    
+            elif timestep_method == 'mean':
+                # Weights of the increments within half a timestep either
+                # side of each output increment
+                half = step//2
+                offsets = np.arange(-half, half + 1)
+                weights = np.clip(step/2. + 0.5 - np.abs(offsets), 0., 1.)
+                totals = np.convolve(np.ones(n_increments), weights,
+                                     mode='same')
+                for key, values in arrays.items():
+                    if key == 'lon':
+                        # Unwrap the longitude so windows crossing the
+                        # antimeridian are averaged correctly
+                        values = values[0] + np.concatenate(([0.], np.cumsum(
+                            (np.diff(values) + 180.) % 360. - 180.)))
+                    mean = np.convolve(values, weights, mode='same')/totals
+                    mean = mean[starts]
+                    if key == 'lon':
+                        mean = (mean + 180.) % 360. - 180.
+                    output[key] = mean.tolist()
+                    
+            else:
+                raise ValueError("method must be either 'decimate' or "
+                                 "'mean'.")
+            
+            outputs[timestep] = output
+        
+        return outputs
+    
+    def _run_indexed(self, chars, indices):
+        """ Runs the Characters at indices of chars in seperate threads. """
+        
+        def run(idx):
+            seed = chars[idx].seed
+            if seed is None and self.seed is not None:
+                seed = rng.derive_seed(self.seed, idx)
+            return self.run_sim(chars[idx], seed)
+            
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            return list(executor.map(self.run_sim, chars))
+            return list(executor.map(run, indices))
             
 
 class Character:
@@ -234,6 +427,8 @@ class Character:
         Parameter dictionary for latitude noise function.
     lon_noise_params : dict
         Parameter dictionary for longitude noise function.
+    seed : int
+        Seed of the random path, noise and velocity functions.
     
     Methods
     -------
@@ -281,6 +476,8 @@ class Character:
             Parameter dictionary for latitude noise function.
         lon_noise_params : dict
             Parameter dictionary for longitude noise function.
+        seed : int
+            Seed of the random path, noise and velocity functions.
         """
         
         self.name                   = 'Character'
@@ -295,6 +492,7 @@ class Character:
         self.lon_func_params        = None
         self.lat_noise_params       = None
         self.lon_noise_params       = None
+        self.seed                   = None
 
 
 class Plot:
@@ -315,6 +513,9 @@ class Plot:
         
     plot_coordinates(results):
         Plots latitude against longitude.
+    
+    animate(results, trail, step, interval, save, fps, writer):
+        Replays the movement of the characters over time.
     """
     
     def __init__(self):
@@ -428,6 +629,141 @@ class Plot:
         
         self.plot_single(results, xlabel, ylabel, fig_title)
         
+    def animate(self, results, trail=50, step=1, interval=40, save=None,
+                fps=25, writer=None):
+        """
+        Replays the movement of the characters over time, drawing the
+        latest position of each character and a trail of its previous
+        positions.
+        
+        Only the moving artists are redrawn each frame (blitting), and the
+        trails are held in fixed-size ring buffers, so long runs with many
+        characters stay interactive.
+        
+        Parameters
+        ----------
+        results : list / dict
+            Dictionary or list of dictionaries of results returned by
+            Simulation.run_sim or Simulation.run_threaded methods.
+        trail : int
+            Number of previous frames drawn behind each character, at least
+            one.
+        step : int
+            Number of time increments advanced per frame, at least one.
+        interval : int
+            Delay between frames in milliseconds when shown interactively.
+        save : str
+            If given, the animation is written to this file without opening
+            a window (e.g. 'fleet.mp4' or 'fleet.gif') instead of shown.
+        fps : int
+            Frame rate of the saved file.
+        writer : str / matplotlib.animation.MovieWriter
+            Writer used to save the file. Chosen by matplotlib if None.
+        
+        Returns
+        -------
+        matplotlib.animation.FuncAnimation
+            The animation, which must be kept referenced while it is shown.
+        """
+        import matplotlib
+        from matplotlib.animation import FuncAnimation
+        from matplotlib.collections import LineCollection
+        
+        if trail < 1 or step < 1:
+            raise ValueError("trail and step must be at least 1.")
+        
+        if not isinstance(results, list):
+            results = [results]
+        
+        # Pad characters with fewer fixes so every frame indexes all of them
+        n_chars = len(results)
+        n_fixes = max(len(result['lat']) for result in results)
+        lat = np.full((n_chars, n_fixes), np.nan)
+        lon = np.full((n_chars, n_fixes), np.nan)
+        for idx, result in enumerate(results):
+            lat[idx, :len(result['lat'])] = result['lat']
+            lon[idx, :len(result['lon'])] = result['lon']
+        stime = max((result['stime'] for result in results), key=len)
+        
+        if save is None:
+            import matplotlib.pyplot as plt
+            fig = plt.figure(figsize=(10, 10))
+        else:
+            # Render off screen so saving works without a display
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            fig = Figure(figsize=(10, 10))
+            FigureCanvasAgg(fig)
+        
+        ax = fig.add_subplot()
+        
+        # Fixed limits, so the blitted background never needs redrawing
+        lat_min, lat_max = np.nanmin(lat), np.nanmax(lat)
+        lon_min, lon_max = np.nanmin(lon), np.nanmax(lon)
+        lat_pad = (lat_max - lat_min)*.05 or 1e-4
+        lon_pad = (lon_max - lon_min)*.05 or 1e-4
+        ax.set_xlim(lon_min - lon_pad, lon_max + lon_pad)
+        ax.set_ylim(lat_min - lat_pad, lat_max + lat_pad)
+        ax.set_xlabel('lon')
+        ax.set_ylabel('lat')
+        ax.tick_params(axis='x', labelrotation=90)
+        fig.suptitle("animate")
+        
+        cycle = matplotlib.rcParams['axes.prop_cycle'].by_key()['color']
+        colors = [cycle[idx % len(cycle)] for idx in range(n_chars)]
+        
+        trails = LineCollection([], colors=colors, linewidths=.8,
+                                animated=True)
+        ax.add_collection(trails)
+        heads = ax.scatter(lon[:, 0], lat[:, 0], s=8, c=colors,
+                           animated=True)
+        label = ax.text(.02, .98, '', transform=ax.transAxes, va='top',
+                        animated=True)
+        
+        # Ring buffers of the trail positions, written at ptr
+        trail_lat = np.full((n_chars, trail), np.nan)
+        trail_lon = np.full((n_chars, trail), np.nan)
+        state = {'ptr': 0}
+        
+        frames = range(0, n_fixes, step)
+        
+        def reset():
+            trail_lat[:] = np.nan
+            trail_lon[:] = np.nan
+            state['ptr'] = 0
+            trails.set_segments([])
+            label.set_text('')
+            return trails, heads, label
+        
+        def update(frame):
+            if frame == frames[0]:
+                reset()
+            
+            ptr = state['ptr']
+            trail_lat[:, ptr] = lat[:, frame]
+            trail_lon[:, ptr] = lon[:, frame]
+            state['ptr'] = (ptr + 1) % trail
+            
+            # Oldest to newest position of each ring buffer
+            order = (state['ptr'] + np.arange(trail)) % trail
+            trails.set_segments(np.stack([trail_lon[:, order],
+                                          trail_lat[:, order]], axis=-1))
+            heads.set_offsets(np.column_stack([lon[:, frame],
+                                               lat[:, frame]]))
+            label.set_text('stime: %s' % stime[min(frame, len(stime) - 1)])
+            
+            return trails, heads, label
+        
+        anim = FuncAnimation(fig, update, frames=frames, init_func=reset,
+                             interval=interval, blit=True)
+        
+        if save is None:
+            plt.show()
+        else:
+            anim.save(save, writer=writer, fps=fps)
+        
+        return anim
+        
     def plot_lat_over_time(self, results):
         """ Not implemented """
         raise NotImplementedError
@@ -3,14 +3,14 @@
 
 def random(t, params):
     """ Random velocity """
-    import random
+    from .rng import get_random
     if params == None:
         b_min = 0.1
         b_max = 1.0
     else:
         b_min = params['min']
         b_max = params['max']
-    velocity = random.uniform(b_min, b_max)
+    velocity = get_random().uniform(b_min, b_max)
     return velocity
 
 def stationary(t, _):
@@ -18,3 +18,12 @@ def stationary(t, _):
 
 def fixed(t, params):
     return params['velocity']
+
+def profile(t, params):
+    """ Velocity of each time increment from a list, then stationary. The
+    timestep must match the Simulation timestep, which run_sim checks """
+    idx = int(round(t/params['timestep']))
+    if idx < len(params['velocities']):
+        return params['velocities'][idx]
+    else:
+        return 0.
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+""" Checks that tracks survive a round trip through the codec """
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from posim import codec
+
+
+def _track(n, dtime=None, stime=None):
+    rng = np.random.default_rng(0)
+    if stime is None:
+        stime = np.arange(n)*0.5
+    if dtime is None:
+        dtime = stime + 100.
+    # Steps of either sign so the deltas are negative as well as positive
+    return {'name': 'track',
+            'dtime': dtime,
+            'stime': stime,
+            'lat': 51.5 + np.cumsum(rng.normal(0., 1e-4, n)),
+            'lon': -0.1 + np.cumsum(rng.normal(0., 1e-4, n))}
+
+
+def _check(decoded, track, precision=1e-7):
+    assert decoded['name'] == track['name']
+    assert np.allclose(decoded['stime'], track['stime'], atol=1e-6)
+    assert np.allclose(decoded['lat'], track['lat'], rtol=0,
+                       atol=precision/2 + 1e-12)
+    assert np.allclose(decoded['lon'], track['lon'], rtol=0,
+                       atol=precision/2 + 1e-12)
+
+
+def test_varint_round_trip():
+    values = np.array([0, 127, 128, 2**14 - 1, 2**14, 2**63, 2**64 - 1],
+                      dtype=np.uint64)
+    data = codec.varint_encode(values)
+
+    assert codec.varint_encode(np.array([127], dtype=np.uint64)) == b'\x7f'
+    assert codec.varint_encode(np.array([128], dtype=np.uint64)) == \
+        b'\x80\x01'
+    assert np.array_equal(codec.varint_decode(data, len(values)), values)
+
+
+def test_varint_decode_short_buffer():
+    data = codec.varint_encode(np.array([1, 300], dtype=np.uint64))
+    with pytest.raises(ValueError):
+        codec.varint_decode(data[:-1], 2)
+
+
+def test_zigzag_negative():
+    values = np.array([0, -1, 1, -2, 2**62, -2**62], dtype=np.int64)
+    encoded = codec._zigzag(values)
+
+    assert list(encoded[:4]) == [0, 1, 2, 3]
+    assert np.array_equal(codec._unzigzag(encoded), values)
+
+
+@pytest.mark.parametrize('n', [0, 1, 100, 1000])
+def test_round_trip_partial_chunk(n):
+    track = _track(n)
+    decoded = codec.decode(codec.encode(track, chunk_size=64))
+
+    _check(decoded, track)
+    assert np.allclose(decoded['dtime'], track['dtime'])
+
+
+def test_round_trip_irregular_stime():
+    stime = np.cumsum(np.random.default_rng(1).uniform(0.1, 2., 500))
+    track = _track(500, stime=stime)
+    decoded = codec.decode(codec.encode(track, chunk_size=64))
+
+    _check(decoded, track)
+
+
+def test_round_trip_datetime():
+    start = datetime(2000, 1, 1, 12, 30)
+    stime = np.arange(300)*0.25
+    dtime = [start + timedelta(seconds=t) for t in stime]
+    track = _track(300, dtime=dtime, stime=stime)
+    decoded = codec.decode(codec.encode(track, chunk_size=64))
+
+    _check(decoded, track)
+    assert list(decoded['dtime']) == dtime
+
+
+def test_read_across_chunks():
+    track = _track(1000)
+    reader = codec.TrackReader(codec.encode(track, chunk_size=64))
+    part = reader.read(60, 200)
+
+    assert reader.n_chunks == 16
+    assert len(part['lat']) == 140
+    assert np.allclose(part['stime'], track['stime'][60:200])
+    assert np.allclose(part['lat'], track['lat'][60:200], rtol=0, atol=1e-7)
+
+    last = reader.read_chunk(reader.n_chunks - 1)
+    assert len(last['lat']) == 1000 - 15*64
+
+
+def test_open_track_closes(tmp_path):
+    track = _track(200)
+    path = tmp_path / 'track.psmt'
+    path.write_bytes(codec.encode(track, chunk_size=64))
+
+    with codec.open_track(str(path)) as reader:
+        _check(reader.read(), track)
+    assert reader._source.closed
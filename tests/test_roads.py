@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+""" Checks that road network characters finish at their destination """
+
+import pytest
+
+from posim import geometry, roads, simulate
+
+
+def _network():
+    # a -> b is 111 m north, b -> c is 139 m east
+    network = roads.RoadNetwork()
+    network.add_node('a', 0., 0.)
+    network.add_node('b', 0.001, 0.)
+    network.add_node('c', 0.001, 0.00125)
+    network.add_edge('a', 'b')
+    network.add_edge('b', 'c')
+    return network
+
+
+@pytest.mark.parametrize('timestep', [0.5, 1, 7])
+def test_character_stops_at_destination(timestep):
+    network = _network()
+    sim = simulate.Simulation()
+    sim.timestep = timestep
+    char = network.character(sim, 'a', 'c', velocity=13.9)
+    result = sim.run_sim(char)
+
+    east, north = geometry.enu(result['lat'][-1], result['lon'][-1],
+                               *network.nodes['c'])
+    assert abs(east) < 0.01 and abs(north) < 0.01
+
+
+def test_character_rejects_other_timestep():
+    sim = simulate.Simulation()
+    char = _network().character(sim, 'a', 'c')
+
+    sim.timestep = 0.5
+    with pytest.raises(ValueError):
+        sim.run_sim(char)